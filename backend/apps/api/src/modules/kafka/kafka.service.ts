@@ -46,16 +46,35 @@ export class KafkaService {
       return;
     }
 
-    const correlationId = this.requestContext.getCorrelationId();
     const producer = await this.getProducer();
+    const headers = this.buildHeaders(message);
     await producer.send({
       topic,
       messages: [
         {
           value: JSON.stringify(message),
-          headers: correlationId ? { "x-correlation-id": correlationId } : undefined
+          headers: Object.keys(headers).length > 0 ? headers : undefined
         }
       ]
     });
   }
+
+  /** Headers de roteamento: permitem aos workers filtrar eventos sem decodificar o payload. */
+  private buildHeaders(message: unknown): Record<string, string> {
+    const headers: Record<string, string> = {};
+    const correlationId = this.requestContext.getCorrelationId();
+    if (correlationId) {
+      headers["x-correlation-id"] = correlationId;
+    }
+    if (message && typeof message === "object") {
+      const envelope = message as Record<string, unknown>;
+      if (typeof envelope.event_type === "string") {
+        headers["x-event-type"] = envelope.event_type;
+      }
+      if (envelope.tenant_id !== undefined && envelope.tenant_id !== null) {
+        headers["x-tenant-id"] = String(envelope.tenant_id);
+      }
+    }
+    return headers;
+  }
 }
@@ -0,0 +1,36 @@
+BEGIN;
+
+-- Fila duravel de webhooks de saida (espelha webhook_incoming_events).
+-- Consumida em lotes com SELECT ... FOR UPDATE SKIP LOCKED por varias replicas do webhook-worker.
+-- status: pending (aguardando envio ou em lease), delivered, failed (tentativas esgotadas).
+CREATE TABLE IF NOT EXISTS webhook_outgoing_deliveries (
+  id SERIAL PRIMARY KEY,
+  uuid UUID UNIQUE NOT NULL DEFAULT gen_random_uuid(),
+  tenant_id INTEGER REFERENCES tenants(id),
+  event_type VARCHAR(255),
+  target_url TEXT NOT NULL,
+  idempotency_key VARCHAR(512),
+  headers_json JSONB,
+  payload_json JSONB NOT NULL,
+  status VARCHAR(64) NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 10,
+  next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+  last_status_code INTEGER,
+  last_error TEXT,
+  delivered_at TIMESTAMP,
+  created_at TIMESTAMP NOT NULL DEFAULT now(),
+  updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- Entregas prontas: o claim ordena por next_attempt_at (tambem usado como lease durante o envio).
+CREATE INDEX IF NOT EXISTS idx_webhook_outgoing_deliveries_next_attempt
+  ON webhook_outgoing_deliveries (next_attempt_at)
+  WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_webhook_outgoing_deliveries_tenant_created
+  ON webhook_outgoing_deliveries (tenant_id, created_at DESC);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_webhook_outgoing_deliveries_idempotency
+  ON webhook_outgoing_deliveries (target_url, idempotency_key)
+  WHERE idempotency_key IS NOT NULL;
+
+COMMIT;
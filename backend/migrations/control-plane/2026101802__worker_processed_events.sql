@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Event_ids ja processados pelos workers Kafka (consumer = consumer group).
+-- O INSERT ... ON CONFLICT DO NOTHING roda na mesma transacao da gravacao das metricas
+-- de uso: reentregas e replays nao contam o evento duas vezes e um crash desfaz os dois.
+CREATE TABLE IF NOT EXISTS worker_processed_events (
+  consumer VARCHAR(128) NOT NULL,
+  event_id VARCHAR(64) NOT NULL,
+  processed_at TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY (consumer, event_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_worker_processed_events_processed_at
+  ON worker_processed_events (processed_at);
+
+COMMIT;
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from kafka import KafkaProducer
+from kafka.future import Future
+
+from app.kafka_config import client_options
+from app.messages import LazyMessage
+
+ERROR_HEADER = "x-dlq-error"
+ATTEMPTS_HEADER = "x-dlq-attempts"
+SOURCE_TOPIC_HEADER = "x-dlq-source-topic"
+SOURCE_PARTITION_HEADER = "x-dlq-source-partition"
+SOURCE_OFFSET_HEADER = "x-dlq-source-offset"
+FAILED_AT_HEADER = "x-dlq-failed-at"
+DLQ_HEADERS = (
+    ERROR_HEADER,
+    ATTEMPTS_HEADER,
+    SOURCE_TOPIC_HEADER,
+    SOURCE_PARTITION_HEADER,
+    SOURCE_OFFSET_HEADER,
+    FAILED_AT_HEADER
+)
+
+_producer: Optional[KafkaProducer] = None
+_producer_lock = threading.Lock()
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+def enabled() -> bool:
+    return (_get_env("KAFKA_DLQ_ENABLED", "true") or "true").lower() == "true"
+
+
+def source_topic() -> str:
+    return _get_env("KAFKA_TOPIC", "erp.events") or "erp.events"
+
+
+def dlq_topic() -> str:
+    return _get_env("KAFKA_DLQ_TOPIC", f"{source_topic()}.dlq") or f"{source_topic()}.dlq"
+
+
+def _get_producer() -> KafkaProducer:
+    global _producer
+    if _producer is not None:
+        return _producer
+    with _producer_lock:
+        if _producer is None:
+            _producer = KafkaProducer(
+                acks="all",
+                linger_ms=int(_get_env("KAFKA_DLQ_LINGER_MS", "50") or 50),
+                **client_options("erp-worker")
+            )
+    return _producer
+
+
+def publish(message: LazyMessage, error: str, attempts: int, logger: logging.Logger) -> Optional[Future]:
+    """Publica o valor original no topico de dead-letter; erro e tentativas vao nos headers.
+
+    O valor nao e reserializado: o replay le o registro exatamente como chegou. Devolve o
+    future do envio (ja falho se o `send` levantar), que o chamador confere depois do
+    `flush` antes de liberar o offset; None com o dead-letter desabilitado.
+    """
+    if not enabled():
+        logger.warning(
+            "Dead-letter desabilitado; evento descartado.",
+            extra={"correlation_id": message.correlation_id, "attempts": attempts, "error": error}
+        )
+        return None
+    headers = _dlq_headers(message, error, attempts)
+    try:
+        future = _get_producer().send(dlq_topic(), value=message.raw, headers=headers)
+    except Exception as exc:
+        logger.error(
+            "Falha ao publicar no dead-letter.",
+            extra={"correlation_id": message.correlation_id, "error": str(exc)}
+        )
+        return Future().failure(exc)
+    future.add_errback(
+        lambda exc: logger.error(
+            "Falha ao publicar no dead-letter.",
+            extra={"correlation_id": message.correlation_id, "error": str(exc)}
+        )
+    )
+    logger.warning(
+        "Evento enviado ao dead-letter.",
+        extra={"correlation_id": message.correlation_id, "attempts": attempts, "error": error, "topic": dlq_topic()}
+    )
+    return future
+
+
+def flush(timeout: Optional[float] = None) -> None:
+    if _producer is not None:
+        _producer.flush(timeout)
+
+
+def close() -> None:
+    global _producer
+    if _producer is not None:
+        _producer.close()
+        _producer = None
+
+
+def _dlq_headers(message: LazyMessage, error: str, attempts: int) -> List[Tuple[str, bytes]]:
+    headers = [
+        (key, value.encode("utf-8"))
+        for key, value in message.headers.items()
+        if key not in DLQ_HEADERS
+    ]
+    headers.extend([
+        (ERROR_HEADER, error[:1000].encode("utf-8")),
+        (ATTEMPTS_HEADER, str(attempts).encode("utf-8")),
+        (SOURCE_TOPIC_HEADER, (message.topic or source_topic()).encode("utf-8")),
+        (FAILED_AT_HEADER, datetime.now(timezone.utc).isoformat().encode("utf-8"))
+    ])
+    if message.partition is not None and message.offset is not None:
+        headers.append((SOURCE_PARTITION_HEADER, str(message.partition).encode("utf-8")))
+        headers.append((SOURCE_OFFSET_HEADER, str(message.offset).encode("utf-8")))
+    return headers
@@ -0,0 +1,39 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class RecentEventIds:
+    """LRU limitado de event_ids ja processados por este processo.
+
+    Caminho rapido para reentregas e replays: o event_id e conferido antes de qualquer
+    I/O. A garantia definitiva continua sendo a chave unica no banco, ja que o cache e
+    por processo e nao sobrevive a restarts.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(0, capacity)
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._ids)
+
+    def seen(self, event_id: Optional[str]) -> bool:
+        if not event_id or not self.capacity:
+            return False
+        with self._lock:
+            if event_id not in self._ids:
+                return False
+            self._ids.move_to_end(event_id)
+            return True
+
+    def add(self, event_id: Optional[str]) -> None:
+        if not event_id or not self.capacity:
+            return
+        with self._lock:
+            self._ids[event_id] = None
+            self._ids.move_to_end(event_id)
+            while len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
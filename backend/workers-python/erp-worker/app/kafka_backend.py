@@ -0,0 +1,249 @@
+import os
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from kafka import KafkaConsumer, TopicPartition
+
+from app.kafka_config import client_options
+
+try:
+    import confluent_kafka
+except ImportError:  # pragma: no cover - depende do ambiente
+    confluent_kafka = None
+
+BACKENDS = ("kafka-python", "confluent")
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+def selected_backend() -> str:
+    """KAFKA_CLIENT_BACKEND: kafka-python (padrao), confluent ou auto (confluent se instalado)."""
+    backend = (_get_env("KAFKA_CLIENT_BACKEND", "kafka-python") or "kafka-python").lower()
+    if backend == "auto":
+        return "confluent" if confluent_kafka is not None else "kafka-python"
+    if backend not in BACKENDS:
+        raise ValueError(f"KAFKA_CLIENT_BACKEND invalido: {backend}")
+    if backend == "confluent" and confluent_kafka is None:
+        raise RuntimeError(
+            "KAFKA_CLIENT_BACKEND=confluent exige o pacote confluent-kafka (requirements-confluent.txt)."
+        )
+    return backend
+
+
+def build_consumer(
+    group_id: str,
+    default_client_id: str,
+    auto_commit: bool,
+    max_poll_records: int,
+    poll_timeout_ms: int
+) -> Any:
+    """Consumer do backend configurado, com a interface do KafkaConsumer usada pelos workers.
+
+    KAFKA_ASSIGNMENT_STRATEGY=cooperative-sticky troca o rebalance eager (todas as
+    particoes revogadas) pelo incremental, e KAFKA_GROUP_INSTANCE_ID habilita a
+    associacao estatica ao grupo: um restart dentro de KAFKA_SESSION_TIMEOUT_MS nao
+    dispara rebalance.
+    """
+    strategy = (_get_env("KAFKA_ASSIGNMENT_STRATEGY", "range") or "range").lower()
+    instance_id = _get_env("KAFKA_GROUP_INSTANCE_ID")
+    session_timeout_ms = _get_env("KAFKA_SESSION_TIMEOUT_MS")
+    max_poll_interval_ms = _get_env("KAFKA_MAX_POLL_INTERVAL_MS")
+    options = client_options(default_client_id)
+
+    if selected_backend() == "confluent":
+        config: Dict[str, Any] = {
+            "bootstrap.servers": ",".join(options["bootstrap_servers"]),
+            "client.id": options["client_id"],
+            "security.protocol": options["security_protocol"],
+            "group.id": group_id,
+            "enable.auto.commit": auto_commit,
+            "auto.offset.reset": "earliest",
+            "partition.assignment.strategy": strategy if strategy == "cooperative-sticky" else "range,roundrobin"
+        }
+        if options["sasl_mechanism"]:
+            config["sasl.mechanisms"] = options["sasl_mechanism"]
+            config["sasl.username"] = options["sasl_plain_username"]
+            config["sasl.password"] = options["sasl_plain_password"]
+        if instance_id:
+            config["group.instance.id"] = instance_id
+        if session_timeout_ms:
+            config["session.timeout.ms"] = int(session_timeout_ms)
+        if max_poll_interval_ms:
+            config["max.poll.interval.ms"] = int(max_poll_interval_ms)
+        return ConfluentConsumer(config, max_poll_records, poll_timeout_ms)
+
+    kwargs: Dict[str, Any] = {}
+    if strategy == "cooperative-sticky":
+        from kafka.coordinator.assignors.cooperative_sticky import CooperativeStickyAssignor
+
+        kwargs["partition_assignment_strategy"] = (CooperativeStickyAssignor,)
+    # So repassa as opcoes quando definidas: versoes antigas do kafka-python rejeitam
+    # parametros desconhecidos.
+    if instance_id:
+        kwargs["group_instance_id"] = instance_id
+    if session_timeout_ms:
+        kwargs["session_timeout_ms"] = int(session_timeout_ms)
+    if max_poll_interval_ms:
+        kwargs["max_poll_interval_ms"] = int(max_poll_interval_ms)
+    return KafkaConsumer(
+        group_id=group_id,
+        enable_auto_commit=auto_commit,
+        auto_offset_reset="earliest",
+        max_poll_records=max_poll_records,
+        consumer_timeout_ms=poll_timeout_ms,
+        **kwargs,
+        **options
+    )
+
+
+class ConsumerRecord(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+    key: Optional[bytes]
+    value: Optional[bytes]
+    headers: List[Tuple[str, bytes]]
+
+
+class ConfluentConsumer:
+    """confluent_kafka.Consumer (librdkafka) exposto com a interface do KafkaConsumer.
+
+    Cobre o subconjunto usado pelos workers: subscribe com listener de rebalance, poll
+    em lote por particao, iteracao com timeout, commits sincronos e assincronos com
+    callback, pause/resume/seek e high watermark em cache para o lag. Particoes sao
+    sempre `kafka.TopicPartition`, como no backend kafka-python.
+
+    O librdkafka chama `on_commit` tambem para commits sincronos; cada resultado e
+    associado ao commit assincrono pelas particoes e offsets, e resultados sem commit
+    assincrono correspondente sao ignorados.
+    """
+
+    def __init__(self, config: Dict[str, Any], max_poll_records: int, poll_timeout_ms: int) -> None:
+        self.max_poll_records = max(1, max_poll_records)
+        self.poll_timeout_ms = poll_timeout_ms
+        self._commit_callbacks: List[Tuple[FrozenSet[Tuple[str, int, int]], Any, Callable[[Any, Any], None]]] = []
+        self._consumer = confluent_kafka.Consumer({**config, "on_commit": self._on_commit})
+
+    def subscribe(self, topics: List[str], listener: Any = None) -> None:
+        if listener is None:
+            self._consumer.subscribe(topics)
+            return
+        self._consumer.subscribe(
+            topics,
+            on_assign=lambda _consumer, partitions: listener.on_partitions_assigned(_to_kafka(partitions)),
+            on_revoke=lambda _consumer, partitions: listener.on_partitions_revoked(_to_kafka(partitions)),
+            on_lost=lambda _consumer, partitions: _on_lost(listener, _to_kafka(partitions))
+        )
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        messages = self._consumer.consume(
+            num_messages=max_records or self.max_poll_records,
+            timeout=max(0, timeout_ms) / 1000
+        )
+        records: Dict[TopicPartition, List[ConsumerRecord]] = {}
+        for message in messages:
+            error = message.error()
+            if error is not None:
+                if error.fatal():
+                    raise confluent_kafka.KafkaException(error)
+                continue
+            tp = TopicPartition(message.topic(), message.partition())
+            records.setdefault(tp, []).append(
+                ConsumerRecord(
+                    message.topic(),
+                    message.partition(),
+                    message.offset(),
+                    message.key(),
+                    message.value(),
+                    message.headers() or []
+                )
+            )
+        return records
+
+    def __iter__(self) -> Iterator[ConsumerRecord]:
+        # Como consumer_timeout_ms no kafka-python: encerra apos um poll vazio.
+        while True:
+            records = self.poll(self.poll_timeout_ms)
+            if not records:
+                return
+            for messages in records.values():
+                yield from messages
+
+    def commit(self, offsets: Dict[TopicPartition, Any]) -> None:
+        self._consumer.commit(offsets=_to_confluent(offsets), asynchronous=False)
+
+    def commit_async(self, offsets: Dict[TopicPartition, Any], callback: Callable[[Any, Any], None]) -> None:
+        partitions = _to_confluent(offsets)
+        entry = (_commit_key(partitions), offsets, callback)
+        self._commit_callbacks.append(entry)
+        try:
+            self._consumer.commit(offsets=partitions, asynchronous=True)
+        except Exception:
+            self._commit_callbacks.remove(entry)
+            raise
+
+    def _on_commit(self, error: Any, partitions: Any) -> None:
+        # Chamado dentro de poll/consume, inclusive para commits sincronos.
+        key = _commit_key(partitions or [])
+        for index, (pending_key, offsets, callback) in enumerate(self._commit_callbacks):
+            if pending_key == key:
+                del self._commit_callbacks[index]
+                break
+        else:
+            return
+        if error is None:
+            error = next((tp.error for tp in partitions or [] if tp.error is not None), None)
+        callback(offsets, confluent_kafka.KafkaException(error) if error is not None else None)
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self._consumer.pause([confluent_kafka.TopicPartition(tp.topic, tp.partition) for tp in partitions])
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self._consumer.resume([confluent_kafka.TopicPartition(tp.topic, tp.partition) for tp in partitions])
+
+    def seek(self, partition: TopicPartition, offset: int) -> None:
+        self._consumer.seek(confluent_kafka.TopicPartition(partition.topic, partition.partition, offset))
+
+    def assignment(self) -> Set[TopicPartition]:
+        return _to_kafka(self._consumer.assignment())
+
+    def highwater(self, partition: TopicPartition) -> Optional[int]:
+        _, high = self._consumer.get_watermark_offsets(
+            confluent_kafka.TopicPartition(partition.topic, partition.partition),
+            cached=True
+        )
+        return high if high >= 0 else None
+
+    def position(self, partition: TopicPartition) -> Optional[int]:
+        positions = self._consumer.position([confluent_kafka.TopicPartition(partition.topic, partition.partition)])
+        offset = positions[0].offset if positions else -1
+        return offset if offset >= 0 else None
+
+    def close(self, autocommit: bool = True) -> None:
+        # O commit automatico no fechamento segue enable.auto.commit.
+        self._consumer.close()
+
+
+def _commit_key(partitions: Iterable[Any]) -> FrozenSet[Tuple[str, int, int]]:
+    return frozenset((tp.topic, tp.partition, tp.offset) for tp in partitions)
+
+
+def _on_lost(listener: Any, partitions: Set[TopicPartition]) -> None:
+    handler = getattr(listener, "on_partitions_lost", None)
+    if handler is not None:
+        handler(partitions)
+        return
+    listener.on_partitions_revoked(partitions)
+
+
+def _to_kafka(partitions: Iterable[Any]) -> Set[TopicPartition]:
+    return {TopicPartition(tp.topic, tp.partition) for tp in partitions}
+
+
+def _to_confluent(offsets: Dict[TopicPartition, Any]) -> List[Any]:
+    return [
+        confluent_kafka.TopicPartition(tp.topic, tp.partition, getattr(meta, "offset", meta))
+        for tp, meta in offsets.items()
+    ]
@@ -0,0 +1,82 @@
+from typing import Any, Dict, Optional
+
+from app import codec
+
+CORRELATION_HEADER = "x-correlation-id"
+EVENT_TYPE_HEADER = "x-event-type"
+TENANT_HEADER = "x-tenant-id"
+
+
+class LazyMessage:
+    """Registro Kafka com headers decodificados e valor decodificado apenas sob demanda.
+
+    Roteamento e filtros usam somente os headers; o JSON do valor so e decodificado na
+    primeira chamada a `payload()`. Picklable para ser enviado aos processos do pool.
+    Topico, particao e offset de origem acompanham a mensagem para o controle de offsets.
+    """
+
+    __slots__ = ("raw", "headers", "topic", "partition", "offset", "_payload", "_decoded")
+
+    def __init__(
+        self,
+        raw: Optional[bytes],
+        headers: Optional[Dict[str, str]] = None,
+        topic: Optional[str] = None,
+        partition: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> None:
+        self.raw = raw
+        self.headers = headers or {}
+        self.topic = topic
+        self.partition = partition
+        self.offset = offset
+        self._payload: Optional[Dict[str, Any]] = None
+        self._decoded = False
+
+    @classmethod
+    def from_record(cls, record: Any) -> "LazyMessage":
+        return cls(
+            getattr(record, "value", None),
+            _decode_headers(getattr(record, "headers", None)),
+            topic=getattr(record, "topic", None),
+            partition=getattr(record, "partition", None),
+            offset=getattr(record, "offset", None)
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self.raw or b"")
+
+    @property
+    def correlation_id(self) -> Optional[str]:
+        return self.headers.get(CORRELATION_HEADER)
+
+    @property
+    def event_type(self) -> Optional[str]:
+        return self.headers.get(EVENT_TYPE_HEADER)
+
+    @property
+    def tenant_id(self) -> Optional[str]:
+        return self.headers.get(TENANT_HEADER)
+
+    def payload(self) -> Optional[Dict[str, Any]]:
+        """Decodifica o valor uma unica vez; erros de decode propagam ao chamador."""
+        if not self._decoded:
+            value = codec.loads(self.raw) if self.raw is not None else None
+            self._payload = value if isinstance(value, dict) else {"payload": value}
+            self._decoded = True
+        return self._payload
+
+
+def _decode_headers(headers: Any) -> Dict[str, str]:
+    decoded: Dict[str, str] = {}
+    if not headers:
+        return decoded
+    for key, value in headers:
+        if value is None:
+            continue
+        try:
+            decoded[key] = value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else str(value)
+        except Exception:
+            continue
+    return decoded
@@ -0,0 +1,80 @@
+import threading
+from typing import Dict, Hashable, Iterable, Optional, Set
+
+
+class OffsetTracker:
+    """Offsets commitaveis por particao para semantica at-least-once.
+
+    `processed` avanca o proximo offset da particao; mensagens estacionadas para retry
+    ficam em `pending` e seguram o commit no menor offset pendente ate serem liberadas
+    (sucesso no retry ou envio ao dead-letter).
+    """
+
+    def __init__(self) -> None:
+        self._next: Dict[Hashable, int] = {}
+        self._pending: Dict[Hashable, Set[int]] = {}
+        self._committed: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def processed(self, partition: Hashable, offset: int) -> None:
+        with self._lock:
+            if offset + 1 > self._next.get(partition, -1):
+                self._next[partition] = offset + 1
+
+    def park(self, partition: Hashable, offset: int) -> None:
+        with self._lock:
+            self._pending.setdefault(partition, set()).add(offset)
+
+    def release(self, partition: Hashable, offset: int) -> None:
+        with self._lock:
+            pending = self._pending.get(partition)
+            if pending is not None:
+                pending.discard(offset)
+
+    def commit_offsets(
+        self,
+        partitions: Optional[Iterable[Hashable]] = None,
+        limit: Optional[Dict[Hashable, int]] = None
+    ) -> Dict[Hashable, int]:
+        """Offsets ainda nao commitados (proximo offset a consumir, convencao do Kafka).
+
+        `limit` impoe um teto por particao; particoes fora dele nao sao commitadas e um
+        teto abaixo do ultimo commit nunca faz o offset voltar.
+        """
+        with self._lock:
+            offsets: Dict[Hashable, int] = {}
+            for partition, offset in self._committable(partitions).items():
+                committed = self._committed.get(partition)
+                if limit is not None:
+                    if partition not in limit:
+                        continue
+                    offset = min(offset, limit[partition])
+                    if committed is not None and offset <= committed:
+                        continue
+                if committed != offset:
+                    offsets[partition] = offset
+            return offsets
+
+    def committable(self) -> Dict[Hashable, int]:
+        """Offset commitavel atual de cada particao, ja commitado ou nao."""
+        with self._lock:
+            return self._committable(None)
+
+    def _committable(self, partitions: Optional[Iterable[Hashable]]) -> Dict[Hashable, int]:
+        selected = list(self._next) if partitions is None else [p for p in partitions if p in self._next]
+        offsets: Dict[Hashable, int] = {}
+        for partition in selected:
+            pending = self._pending.get(partition)
+            offsets[partition] = min(pending) if pending else self._next[partition]
+        return offsets
+
+    def mark_committed(self, offsets: Dict[Hashable, int]) -> None:
+        with self._lock:
+            self._committed.update(offsets)
+
+    def forget(self, partitions: Iterable[Hashable]) -> None:
+        with self._lock:
+            for partition in partitions:
+                self._next.pop(partition, None)
+                self._pending.pop(partition, None)
+                self._committed.pop(partition, None)
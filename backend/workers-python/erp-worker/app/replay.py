@@ -0,0 +1,171 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from kafka import KafkaConsumer, TopicPartition
+
+from app import dead_letter
+from app.consumer import _get_usage_aggregator, _process_attempt, _record_usage, _setup_logger
+from app.kafka_config import client_options
+from app.messages import LazyMessage
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reprocessa um intervalo do topico de dead-letter.")
+    parser.add_argument("--topic", default=dead_letter.dlq_topic())
+    parser.add_argument("--partition", type=int, action="append", dest="partitions")
+    parser.add_argument("--start-offset", type=int, default=None, help="Inclusivo; padrao: inicio da particao.")
+    parser.add_argument("--end-offset", type=int, default=None, help="Exclusivo; padrao: fim atual da particao.")
+    parser.add_argument("--rate", type=float, default=float(_get_env("REPLAY_RATE_PER_SECOND", "50") or 50))
+    parser.add_argument("--workers", type=int, default=int(_get_env("REPLAY_WORKERS", "2") or 2))
+    return parser.parse_args(argv)
+
+
+def replay_message(message: LazyMessage) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Uma tentativa via `_process_payload`; executa em um processo do pool."""
+    logger = logging.getLogger("erp-worker")
+    try:
+        payload = message.payload()
+    except Exception as exc:
+        return [], str(exc)
+    usage: List[Dict[str, Any]] = []
+    error = _process_attempt(payload, logger, usage)
+    return usage, error
+
+
+def _resolve_ranges(
+    consumer: KafkaConsumer,
+    topic: str,
+    partitions: Optional[List[int]],
+    start_offset: Optional[int],
+    end_offset: Optional[int]
+) -> Dict[TopicPartition, Tuple[int, int]]:
+    available = consumer.partitions_for_topic(topic) or set()
+    selected = [TopicPartition(topic, p) for p in sorted(partitions or available) if p in available]
+    beginnings = consumer.beginning_offsets(selected)
+    ends = consumer.end_offsets(selected)
+    ranges: Dict[TopicPartition, Tuple[int, int]] = {}
+    for tp in selected:
+        start = beginnings[tp] if start_offset is None else max(start_offset, beginnings[tp])
+        end = ends[tp] if end_offset is None else min(end_offset, ends[tp])
+        if start < end:
+            ranges[tp] = (start, end)
+    return ranges
+
+
+def replay(
+    topic: str,
+    partitions: Optional[List[int]] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    rate: float = 50.0,
+    workers: int = 2
+) -> Tuple[int, int]:
+    """Re-alimenta um intervalo do DLQ no pipeline normal; retorna (reprocessados, falhas).
+
+    Roda fora do consumer group (assign manual) e limita a taxa para nao competir com o
+    trafego ao vivo pelo banco. Falhas do replay permanecem no DLQ e sao apenas reportadas.
+    """
+    logger = logging.getLogger("erp-worker")
+    consumer = KafkaConsumer(
+        group_id=None,
+        enable_auto_commit=False,
+        **client_options("erp-worker-replay")
+    )
+    ranges = _resolve_ranges(consumer, topic, partitions, start_offset, end_offset)
+    if not ranges:
+        logger.info("Nada para reprocessar.", extra={"topic": topic})
+        consumer.close()
+        return 0, 0
+
+    consumer.assign(list(ranges))
+    for tp, (start, _) in ranges.items():
+        consumer.seek(tp, start)
+
+    interval = 1.0 / rate if rate > 0 else 0.0
+    max_in_flight = max(1, workers) * 2
+    executor = ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_setup_logger
+    )
+    in_flight: Set[Future] = set()
+    replayed = failed = 0
+    next_send_at = time.monotonic()
+    logger.info(
+        "Replay do dead-letter iniciado.",
+        extra={"topic": topic, "partitions": len(ranges), "rate": rate, "workers": workers}
+    )
+
+    def _drain(return_when: str) -> None:
+        nonlocal in_flight, replayed, failed
+        done, in_flight = wait(in_flight, return_when=return_when)
+        usage: List[Dict[str, Any]] = []
+        for future in done:
+            try:
+                message_usage, error = future.result()
+            except Exception as exc:
+                message_usage, error = [], str(exc)
+            usage.extend(message_usage)
+            if error is None:
+                replayed += 1
+            else:
+                failed += 1
+                logger.warning("Falha ao reprocessar evento do dead-letter.", extra={"error": error})
+        _record_usage(usage, logger)
+
+    try:
+        pending = dict(ranges)
+        while pending:
+            records = consumer.poll(timeout_ms=int(_get_env("KAFKA_POLL_TIMEOUT_MS", "1000") or 1000))
+            for tp, messages in records.items():
+                _, end = pending.get(tp, (0, 0))
+                for record in messages:
+                    if record.offset >= end:
+                        break
+                    now = time.monotonic()
+                    if next_send_at > now:
+                        time.sleep(next_send_at - now)
+                    next_send_at = max(next_send_at, now) + interval
+                    if len(in_flight) >= max_in_flight:
+                        _drain(FIRST_COMPLETED)
+                    in_flight.add(executor.submit(replay_message, LazyMessage.from_record(record)))
+                if consumer.position(tp) >= end:
+                    pending.pop(tp, None)
+                    consumer.pause(tp)
+        if in_flight:
+            _drain(ALL_COMPLETED)
+        _get_usage_aggregator().flush()
+    finally:
+        executor.shutdown()
+        consumer.close()
+
+    logger.info("Replay do dead-letter concluido.", extra={"replayed": replayed, "failed": failed})
+    return replayed, failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    _setup_logger()
+    args = _parse_args(argv)
+    _, failed = replay(
+        args.topic,
+        partitions=args.partitions,
+        start_offset=args.start_offset,
+        end_offset=args.end_offset,
+        rate=args.rate,
+        workers=args.workers
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
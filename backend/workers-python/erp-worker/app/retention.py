@@ -0,0 +1,188 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+from app import codec
+
+# Pastas nomeadas pela data (ex.: `2026-10-18T12-30-45-123Z`, gerada pela API no
+# claim-check, ou `2026-10-18`) expiram inteiras sem stat dos arquivos.
+_DATED_DIR = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+_CURSOR_FILE = ".retention-cursor.json"
+
+
+class RetentionEngine:
+    """Limpeza de retencao em background, incremental e retomavel.
+
+    O storage local e percorrido com `os.scandir` em ordem lexica; cada fatia de
+    `slice_seconds` processa o que couber e devolve o controle, com pausa de
+    `pause_seconds` entre fatias. Diretorios com data no nome (`YYYY-MM-DD...` ou
+    `YYYY/MM/DD`) anteriores ao corte sao removidos de uma vez. A posicao da varredura
+    fica em um cursor persistido, para que um restart continue de onde parou.
+
+    O ERP worker nao usa claim-check, entao so o storage local e limpo aqui; a
+    retencao no MinIO fica com o telemetry-worker.
+    """
+
+    def __init__(
+        self,
+        retention_days: int,
+        base_path: Optional[str],
+        logger: logging.Logger,
+        interval: float = 3600.0,
+        slice_seconds: float = 0.2,
+        pause_seconds: float = 1.0,
+        cursor_path: Optional[str] = None
+    ) -> None:
+        self.retention_days = retention_days
+        self.base_path = base_path
+        self.logger = logger
+        self.interval = interval
+        self.slice_seconds = slice_seconds
+        self.pause_seconds = pause_seconds
+        self.cursor_path = cursor_path
+        self._cursor: Dict[str, Optional[str]] = self._load_cursor()
+        self._local_walk: Optional[Iterator[Tuple[str, ...]]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not self.base_path:
+            return
+        self._thread = threading.Thread(target=self._run, name="storage-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._save_cursor()
+
+    def _run(self) -> None:
+        delay = 0.0
+        while not self._stop.wait(delay):
+            try:
+                finished = self.run_slice()
+            except Exception as exc:
+                self.logger.warning("Falha na limpeza de retencao.", extra={"error": str(exc)})
+                self._local_walk = None
+                finished = True
+            delay = self.interval if finished else self.pause_seconds
+
+    def run_slice(self) -> bool:
+        """Processa ate `slice_seconds`; True quando a passada atual terminou."""
+        deadline = time.monotonic() + self.slice_seconds
+        done = self._local_slice(deadline)
+        self._save_cursor()
+        return done
+
+    def _cutoff(self) -> float:
+        return time.time() - self.retention_days * 86400
+
+    # Storage local
+
+    def _local_slice(self, deadline: float) -> bool:
+        if not self.base_path or not os.path.isdir(self.base_path):
+            return True
+        if self._local_walk is None:
+            start = tuple(filter(None, (self._cursor.get("local") or "").split("/")))
+            self._local_walk = self._walk_local(self.base_path, (), start, self._cutoff())
+        for parts in self._local_walk:
+            self._cursor["local"] = "/".join(parts)
+            if time.monotonic() >= deadline:
+                return False
+        self._local_walk = None
+        self._cursor["local"] = None
+        return True
+
+    def _walk_local(
+        self,
+        path: str,
+        parts: Tuple[str, ...],
+        start: Tuple[str, ...],
+        cutoff: float
+    ) -> Iterator[Tuple[str, ...]]:
+        try:
+            with os.scandir(path) as entries:
+                names = sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries)
+        except FileNotFoundError:
+            return
+        for name, is_dir in names:
+            if not parts and name.startswith(_CURSOR_FILE):
+                continue
+            entry_parts = parts + (name,)
+            resuming = len(start) > len(entry_parts) and start[: len(entry_parts)] == entry_parts
+            if not resuming and entry_parts <= start:
+                continue
+            entry_path = os.path.join(path, name)
+            if is_dir:
+                if _expired_directory(entry_parts, cutoff):
+                    shutil.rmtree(entry_path, ignore_errors=True)
+                else:
+                    yield from self._walk_local(entry_path, entry_parts, start if resuming else (), cutoff)
+                    _remove_if_empty(entry_path)
+            else:
+                try:
+                    if os.stat(entry_path, follow_symlinks=False).st_mtime < cutoff:
+                        os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as exc:
+                    self.logger.warning("Falha ao limpar arquivo antigo.", extra={"error": str(exc), "path": entry_path})
+            yield entry_parts
+
+    # Cursor
+
+    def _load_cursor(self) -> Dict[str, Optional[str]]:
+        if not self.cursor_path:
+            return {}
+        try:
+            with open(self.cursor_path, "rb") as handle:
+                cursor = codec.loads(handle.read())
+            return cursor if isinstance(cursor, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as exc:
+            self.logger.warning("Cursor de retencao invalido; varredura reiniciada.", extra={"error": str(exc)})
+            return {}
+
+    def _save_cursor(self) -> None:
+        if not self.cursor_path:
+            return
+        temp_path = f"{self.cursor_path}.tmp"
+        try:
+            with open(temp_path, "wb") as handle:
+                handle.write(codec.dumps(self._cursor))
+            os.replace(temp_path, self.cursor_path)
+        except Exception as exc:
+            self.logger.warning("Falha ao salvar cursor de retencao.", extra={"error": str(exc)})
+
+
+def _expired_directory(parts: Tuple[str, ...], cutoff: float) -> bool:
+    day = _directory_day(parts)
+    if day is None:
+        return False
+    return (day + timedelta(days=1)).timestamp() <= cutoff
+
+
+def _directory_day(parts: Tuple[str, ...]) -> Optional[datetime]:
+    try:
+        match = _DATED_DIR.match(parts[-1])
+        if match:
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)), tzinfo=timezone.utc)
+        if len(parts) >= 3 and all(part.isdigit() for part in parts[-3:]) and len(parts[-3]) == 4:
+            return datetime(int(parts[-3]), int(parts[-2]), int(parts[-1]), tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return None
+
+
+def _remove_if_empty(path: str) -> None:
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
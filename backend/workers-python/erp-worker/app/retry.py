@@ -0,0 +1,59 @@
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+
+@dataclass
+class RetryEntry:
+    message: Any
+    attempts: int
+    error: str
+    due_at: float
+
+
+class RetryScheduler:
+    """Fila de retries com atraso (heap ordenado por vencimento), sem bloquear o consumo.
+
+    Mensagens que falharam ficam estacionadas ate o vencimento do backoff exponencial
+    (`base_delay * 2^(tentativa-1)`, limitado a `max_delay`). `schedule` devolve False
+    quando as tentativas acabaram ou a fila esta cheia: o chamador envia ao dead-letter.
+    """
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float, capacity: int) -> None:
+        self.max_retries = max(0, max_retries)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.capacity = max(1, capacity)
+        self._heap: List[Tuple[float, int, RetryEntry]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+    def schedule(self, message: Any, attempts: int, error: str) -> bool:
+        if attempts > self.max_retries:
+            return False
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        with self._lock:
+            if len(self._heap) >= self.capacity:
+                return False
+            entry = RetryEntry(message=message, attempts=attempts, error=error, due_at=time.monotonic() + delay)
+            heapq.heappush(self._heap, (entry.due_at, next(self._counter), entry))
+        return True
+
+    def pop_due(self, now: Optional[float] = None) -> List[RetryEntry]:
+        now = time.monotonic() if now is None else now
+        due: List[RetryEntry] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def pending(self) -> List[RetryEntry]:
+        with self._lock:
+            return [entry for _, _, entry in self._heap]
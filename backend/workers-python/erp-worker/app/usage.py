@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+UsageKey = Tuple[str, str, str, str]
+# event_id -> linhas de uso do evento, gravadas so se o claim do evento for novo.
+ClaimedUsage = Dict[str, List[Dict[str, Any]]]
+
+
+class UsageAggregator:
+    """Soma metricas de uso em memoria por (tenant_id, metric_key, period, source).
+
+    O flush acontece quando o numero de chaves atinge `max_keys` ou quando
+    `flush_interval` segundos passaram desde o ultimo flush; cada flush entrega
+    todas as linhas agregadas ao `writer` em uma unica chamada.
+
+    Metricas com `event_id` ficam separadas por evento e vao ao `writer` como
+    `claimed`: ele registra o claim de cada evento na mesma transacao do uso e descarta
+    o uso de eventos ja contados (reentregas).
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[List[Dict[str, Any]], ClaimedUsage], None],
+        max_keys: int = 1000,
+        flush_interval: float = 10.0
+    ) -> None:
+        self._writer = writer
+        self._max_keys = max(1, max_keys)
+        self._flush_interval = max(0.0, flush_interval)
+        self._totals: Dict[UsageKey, int] = {}
+        self._claimed: ClaimedUsage = {}
+        self._lock = threading.Lock()
+        self._last_flush_at = time.monotonic()
+
+    def add(self, metrics: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for metric in metrics:
+                event_id = metric.get("event_id")
+                if event_id:
+                    self._claimed.setdefault(str(event_id), []).append(_row(_key(metric), int(metric["metric_value"])))
+                    continue
+                key = _key(metric)
+                self._totals[key] = self._totals.get(key, 0) + int(metric["metric_value"])
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._totals) + len(self._claimed)
+
+    def should_flush(self) -> bool:
+        with self._lock:
+            if not self._totals and not self._claimed:
+                return False
+            if len(self._totals) + len(self._claimed) >= self._max_keys:
+                return True
+            return time.monotonic() - self._last_flush_at >= self._flush_interval
+
+    def maybe_flush(self) -> int:
+        if not self.should_flush():
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """Grava o buffer; em caso de falha as contagens voltam ao buffer e o erro propaga."""
+        with self._lock:
+            totals, claimed = self._totals, self._claimed
+            self._totals, self._claimed = {}, {}
+            self._last_flush_at = time.monotonic()
+        if not totals and not claimed:
+            return 0
+
+        rows = [_row(key, value) for key, value in totals.items()]
+        try:
+            self._writer(rows, claimed)
+        except Exception:
+            with self._lock:
+                for key, value in totals.items():
+                    self._totals[key] = self._totals.get(key, 0) + value
+                for event_id, event_rows in claimed.items():
+                    self._claimed.setdefault(event_id, []).extend(event_rows)
+            raise
+        return len(rows) + len(claimed)
+
+
+def merge_rows(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Soma linhas de uso com a mesma chave (tenant_id, metric_key, period, source)."""
+    totals: Dict[UsageKey, int] = {}
+    for row in rows:
+        key = _key(row)
+        totals[key] = totals.get(key, 0) + int(row["metric_value"])
+    return [_row(key, value) for key, value in totals.items()]
+
+
+def _key(metric: Dict[str, Any]) -> UsageKey:
+    return (str(metric["tenant_id"]), metric["metric_key"], metric["period"], metric.get("source") or "worker")
+
+
+def _row(key: UsageKey, value: int) -> Dict[str, Any]:
+    tenant_id, metric_key, period, source = key
+    return {
+        "tenant_id": tenant_id,
+        "metric_key": metric_key,
+        "metric_value": value,
+        "period": period,
+        "source": source
+    }
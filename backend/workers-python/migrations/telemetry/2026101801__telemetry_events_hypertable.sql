@@ -0,0 +1,36 @@
+BEGIN;
+
+-- Itens de telemetria persistidos pelo telemetry-worker (um registro por item de `items`).
+-- Escrita exclusivamente via COPY em lote; sem chave primaria para manter o COPY barato.
+-- tenant_id aceita NULL como o writer original: telemetria sem tenant e gravada, nao descartada.
+CREATE TABLE IF NOT EXISTS telemetry_events (
+  time TIMESTAMPTZ NOT NULL,
+  tenant_id VARCHAR(64),
+  event_id VARCHAR(64),
+  item_index INTEGER NOT NULL DEFAULT 0,
+  payload JSONB NOT NULL,
+  ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Converte em hypertable quando a extensao TimescaleDB estiver disponivel no servidor.
+-- Sem a extensao a tabela continua funcional como tabela comum.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb') THEN
+    CREATE EXTENSION IF NOT EXISTS timescaledb;
+    PERFORM create_hypertable(
+      'telemetry_events',
+      'time',
+      chunk_time_interval => INTERVAL '1 day',
+      if_not_exists => TRUE
+    );
+  END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_telemetry_events_tenant_time
+  ON telemetry_events (tenant_id, time DESC);
+CREATE INDEX IF NOT EXISTS idx_telemetry_events_event_id
+  ON telemetry_events (event_id);
+
+COMMIT;
@@ -0,0 +1,14 @@
+BEGIN;
+
+-- Event_ids ja ingeridos pelo telemetry-worker. O INSERT ... ON CONFLICT DO NOTHING
+-- roda na mesma transacao do COPY dos itens, tornando reentregas e replays idempotentes.
+CREATE TABLE IF NOT EXISTS telemetry_ingested_events (
+  event_id VARCHAR(64) PRIMARY KEY,
+  tenant_id VARCHAR(64),
+  ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_telemetry_ingested_events_ingested_at
+  ON telemetry_ingested_events (ingested_at);
+
+COMMIT;
@@ -0,0 +1,44 @@
+import json
+import os
+from typing import Any, Callable, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - depende do ambiente
+    msgspec = None
+
+
+def _stdlib_loads(data: Any) -> Any:
+    return json.loads(data)
+
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _select_codec() -> Tuple[str, Callable[[Any], Any], Callable[[Any], bytes]]:
+    """Escolhe o codec via JSON_CODEC (auto, orjson, msgspec, json)."""
+    preferred = (os.getenv("JSON_CODEC") or "auto").lower()
+    if preferred in ("auto", "orjson") and orjson is not None:
+        return "orjson", orjson.loads, orjson.dumps
+    if preferred in ("auto", "msgspec") and msgspec is not None:
+        return "msgspec", msgspec.json.decode, msgspec.json.encode
+    return "json", _stdlib_loads, _stdlib_dumps
+
+
+CODEC_NAME, _loads, _dumps = _select_codec()
+
+
+def loads(data: Any) -> Any:
+    """Decodifica JSON direto de bytes (ou str), sem decode intermediario."""
+    return _loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """Serializa em JSON compacto (UTF-8)."""
+    return _dumps(value)
@@ -1,36 +1,45 @@
-import json
+import multiprocessing
 import os
+import signal
 import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Any, Dict, Optional
+from itertools import islice
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import logging
-import requests
-import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-from kafka import KafkaConsumer
-from pythonjsonlogger import jsonlogger
+from psycopg2.extras import execute_values
+from kafka import ConsumerRebalanceListener, KafkaConsumer, TopicPartition
+from kafka.structs import OffsetAndMetadata
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 import gzip
+import io
+import ijson
+
+from app import codec, db, dead_letter, http_client, kafka_backend, logs, metrics, storage_gc
+from app.dedup import RecentEventIds
+from app.fairness import TenantFairScheduler, parse_tenant_map
+from app.flow_control import AdaptiveBatchController
+from app.lanes import HeavyLane
+from app.messages import LazyMessage
+from app.offsets import OffsetTracker
+from app.prefetch import ClaimCheckPrefetcher
+from app.retention import RetentionEngine
+from app.retry import RetryEntry, RetryScheduler
+from app.storage_gc import DeleteTarget, DeletionQueue
+from app.tenant_routing import TenantRouter
+from app.usage import UsageAggregator
+from app.processors.telemetry_store import build_item_rows, claim_event, copy_rows
+
+# event_type (e header x-event-type) que a API publica para uploads em claim-check.
+CLAIM_CHECK_EVENT_TYPE = "telemetry.bulk.claim_check"
 
 
 def _setup_logger() -> logging.Logger:
-    logger = logging.getLogger("telemetry-worker")
-    level = os.getenv("LOG_LEVEL", "info").upper()
-    if (os.getenv("DEBUG", "false") or "false").lower() == "true" and level == "INFO":
-        level = "DEBUG"
-    logger.setLevel(level)
-    handler = logging.StreamHandler()
-    log_format = os.getenv("LOG_FORMAT", "json").lower()
-    if log_format == "text":
-        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
-    else:
-        formatter = jsonlogger.JsonFormatter(
-            "%(asctime)s %(levelname)s %(name)s %(message)s %(correlation_id)s"
-        )
-    handler.setFormatter(formatter)
-    logger.handlers = [handler]
-    return logger
+    return logs.setup_logger("telemetry-worker")
 
 
 def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
@@ -38,68 +47,86 @@ def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
     return value if value is not None and value != "" else default
 
 
-_pool: Optional[SimpleConnectionPool] = None
-_last_cleanup_at: float = 0.0
 _minio_client: Optional[Minio] = None
+_prefetcher: Optional[ClaimCheckPrefetcher] = None
+_heavy_lane: Optional[HeavyLane] = None
+_deletion_queue: Optional[DeletionQueue] = None
+_tenant_router: Optional[TenantRouter] = None
+# Resultado da gravacao agrupada do lote atual (event_id -> itens gravados, ou None se duplicado).
+_grouped_results: Dict[str, Optional[int]] = {}
+_usage_aggregator: Optional[UsageAggregator] = None
+_retry_scheduler: Optional[RetryScheduler] = None
+_offset_tracker = OffsetTracker()
+_recent_events: Optional[RecentEventIds] = None
+_shutdown_requested: bool = False
+_retention: Optional[RetentionEngine] = None
+_lag_updated_at: float = 0.0
+_flow_controller: Optional[AdaptiveBatchController] = None
+_fair_scheduler: Optional[TenantFairScheduler] = None
+_backpressure_active: bool = False
+# Offsets cujo uso ja esta gravado: capturados antes de cada flush bem-sucedido do
+# UsageAggregator (ou em um commit com o buffer vazio).
+_usage_covered: Dict[TopicPartition, int] = {}
+# Envios ao dead-letter aguardando confirmacao e os que falharam, a republicar.
+_dead_letter_sends: List[Tuple[RetryEntry, Any]] = []
+_dead_letter_failed: List[RetryEntry] = []
+_process_pool: Optional[ProcessPoolExecutor] = None
+# Particoes com lote falho no modo paralelo: (falhas seguidas, retomar em; 0 = ja retomada).
+_partition_backoff: Dict[TopicPartition, Tuple[int, float]] = {}
 
 
-def _get_db_pool() -> Optional[SimpleConnectionPool]:
-    global _pool
-    if _pool is not None:
-        return _pool
+def _get_db_pool() -> db.DatabasePool:
+    return db.get_pool(db.database_url())
 
-    pool_size = int(_get_env("DATABASE_POOL_SIZE", "5") or 5)
-    max_overflow = int(_get_env("DATABASE_MAX_OVERFLOW", "5") or 5)
-    max_conn = max(pool_size, pool_size + max_overflow)
 
-    database_url = _get_env("DATABASE_URL")
-    if not database_url:
-        host = _get_env("POSTGRES_HOST", "localhost")
-        port = _get_env("POSTGRES_PORT", "5432")
-        user = _get_env("POSTGRES_USER", "postgres")
-        password = _get_env("POSTGRES_PASSWORD", "")
-        db = _get_env("POSTGRES_DB", "control_plane")
-        database_url = f"postgresql://{user}:{password}@{host}:{port}/{db}"
+def _default_telemetry_dsn() -> str:
+    return _get_env("TELEMETRY_DATABASE_URL") or db.database_url()
+
+
+def _get_tenant_router() -> TenantRouter:
+    global _tenant_router
+    if _tenant_router is None:
+        _tenant_router = TenantRouter(
+            _get_db_pool,
+            _default_telemetry_dsn(),
+            ttl=float(_get_env("TENANT_DB_CACHE_TTL_SECONDS", "60") or 60)
+        )
+    return _tenant_router
 
-    try:
-        _pool = SimpleConnectionPool(1, max_conn, dsn=database_url)
-    except Exception:
-        _pool = None
-    return _pool
+
+def _telemetry_dsn(tenant_id: Any) -> str:
+    """Banco de telemetria do tenant (tenants.telemetry_db) quando o roteamento esta habilitado."""
+    if (_get_env("TELEMETRY_DB_ROUTING_ENABLED", "false") or "false").lower() != "true":
+        return _default_telemetry_dsn()
+    return _get_tenant_router().dsn_for(tenant_id)
+
+
+def _get_telemetry_db_pool(tenant_id: Any = None) -> db.DatabasePool:
+    return _get_pool_for_dsn(_telemetry_dsn(tenant_id))
+
+
+def _get_pool_for_dsn(dsn: str) -> db.DatabasePool:
+    if dsn == _default_telemetry_dsn():
+        return db.get_pool(dsn)
+    # Bancos dedicados a tenants recebem pools pequenos; o registro fecha os ociosos.
+    return db.get_pool(
+        dsn,
+        pool_size=int(_get_env("TENANT_DATABASE_POOL_SIZE", "1") or 1),
+        max_overflow=int(_get_env("TENANT_DATABASE_MAX_OVERFLOW", "2") or 2)
+    )
 
 
 def _build_consumer() -> KafkaConsumer:
-    brokers = _get_env("KAFKA_BROKERS", "kafka:9092")
-    client_id = _get_env("KAFKA_CLIENT_ID", "telemetry-worker")
     group_id = _get_env("KAFKA_GROUP_ID", "telemetry-workers")
-    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "true") or "true").lower() == "true"
+    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
     batch_size = int(_get_env("KAFKA_BATCH_SIZE", "100") or 100)
-    ssl_enabled = _get_env("KAFKA_SSL", "false") == "true"
-    sasl_mechanism = _get_env("KAFKA_SASL_MECHANISM")
-    sasl_username = _get_env("KAFKA_SASL_USERNAME")
-    sasl_password = _get_env("KAFKA_SASL_PASSWORD")
-
-    security_protocol = "PLAINTEXT"
-    if ssl_enabled and sasl_mechanism:
-        security_protocol = "SASL_SSL"
-    elif sasl_mechanism:
-        security_protocol = "SASL_PLAINTEXT"
-    elif ssl_enabled:
-        security_protocol = "SSL"
-
-    return KafkaConsumer(
-        _get_env("KAFKA_TOPIC", "telemetry.events"),
-        bootstrap_servers=brokers.split(","),
-        client_id=client_id,
-        group_id=group_id,
-        enable_auto_commit=auto_commit,
-        auto_offset_reset="earliest",
+
+    return kafka_backend.build_consumer(
+        group_id,
+        "telemetry-worker",
+        auto_commit,
         max_poll_records=batch_size,
-        value_deserializer=lambda v: json.loads(v.decode("utf-8")),
-        security_protocol=security_protocol,
-        sasl_mechanism=sasl_mechanism,
-        sasl_plain_username=sasl_username,
-        sasl_plain_password=sasl_password
+        poll_timeout_ms=int(_get_env("KAFKA_POLL_TIMEOUT_MS", "1000") or 1000)
     )
 
 
@@ -112,76 +139,1117 @@ def start_consumer() -> None:
             time.sleep(5)
 
     consumer = _build_consumer()
-    logger.info("Telemetry consumer started.")
+    consumer.subscribe(
+        [_get_env("KAFKA_TOPIC", "telemetry.events")],
+        listener=_CommitOnRevoke(consumer, logger)
+    )
+    _install_signal_handlers(logger)
+    _start_metrics_server(logger)
+    _start_retention(logger)
+    logger.info("Telemetry consumer started.", extra={"json_codec": codec.CODEC_NAME})
 
-    for message in consumer:
-        payload = _normalize_message(message.value)
-        correlation_id = _extract_correlation_id(message)
-        logger.info(
-            "Telemetry event received.",
-            extra={"correlation_id": correlation_id, "data": payload}
+    if (_get_env("KAFKA_CONSUME_MODE", "batch") or "batch").lower() == "batch":
+        processes = int(_get_env("WORKER_PROCESSES", "1") or 1)
+        if processes > 1:
+            _consume_partitions_parallel(consumer, processes, logger)
+        else:
+            _consume_batches(consumer, logger)
+    else:
+        _consume_stream(consumer, logger)
+    _shutdown(consumer, logger)
+
+
+def _start_metrics_server(logger: logging.Logger) -> None:
+    if (_get_env("METRICS_ENABLED", "true") or "true").lower() != "true":
+        return
+    port = int(_get_env("METRICS_PORT", "9100") or 9100)
+    started = metrics.start_server(
+        port,
+        pool_stats=lambda: {dsn: pool.stats() for dsn, pool in db.all_pools().items()},
+        retry_queue_size=lambda: len(_get_retry_scheduler())
+    )
+    if started:
+        logger.info("Endpoint de metricas habilitado.", extra={"port": port})
+    else:
+        logger.warning("prometheus_client nao instalado; endpoint de metricas desabilitado.")
+
+
+def _update_lag(consumer: KafkaConsumer) -> None:
+    """Lag por particao a partir do high watermark em cache (sem chamadas extras ao broker)."""
+    global _lag_updated_at
+    now = time.monotonic()
+    if now - _lag_updated_at < float(_get_env("METRICS_LAG_INTERVAL_SECONDS", "5") or 5):
+        return
+    _lag_updated_at = now
+    lags: Dict[TopicPartition, int] = {}
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        position = consumer.position(tp) if highwater is not None else None
+        if position is not None:
+            lags[tp] = max(0, highwater - position)
+    metrics.set_lag(lags)
+
+
+def _get_flow_controller() -> AdaptiveBatchController:
+    global _flow_controller
+    if _flow_controller is None:
+        batch_size = int(_get_env("KAFKA_BATCH_SIZE", "100") or 100)
+        _flow_controller = AdaptiveBatchController(
+            batch_size,
+            min_batch=int(_get_env("KAFKA_BATCH_SIZE_MIN", "10") or 10),
+            max_batch=int(_get_env("KAFKA_BATCH_SIZE_MAX", str(batch_size * 10)) or batch_size * 10),
+            chunk_size=int(_get_env("BULK_INSERT_BATCH_SIZE", "1000") or 1000),
+            min_chunk=int(_get_env("BULK_INSERT_BATCH_SIZE_MIN", "100") or 100),
+            target_batch_seconds=float(_get_env("KAFKA_TARGET_BATCH_SECONDS", "5") or 5),
+            max_poll_interval=int(_get_env("KAFKA_MAX_POLL_INTERVAL_MS", "300000") or 300000) / 1000,
+            pressure_latency=float(_get_env("BACKPRESSURE_LATENCY_SECONDS", "2") or 2),
+            memory_limit=int(_get_env("WORKER_MEMORY_LIMIT_MB", "0") or 0) * 1024 * 1024,
+            max_pause_seconds=float(_get_env("BACKPRESSURE_MAX_PAUSE_SECONDS", "30") or 30),
+            enabled=(_get_env("ADAPTIVE_BATCHING_ENABLED", "true") or "true").lower() == "true"
         )
-        _process_with_retries(payload, logger)
+    return _flow_controller
+
+
+def _apply_backpressure(
+    consumer: KafkaConsumer,
+    logger: logging.Logger,
+    busy: Iterable[TopicPartition] = ()
+) -> None:
+    """Pausa as particoes atribuidas enquanto Postgres/MinIO estao lentos; o poll segue ativo.
+
+    `busy` sao particoes que o loop pausou por conta propria (lote em voo) e que ele mesmo
+    retoma.
+    """
+    global _backpressure_active
+    busy = set(busy)
+    if _get_flow_controller().should_pause():
+        partitions = [tp for tp in consumer.assignment() if tp not in busy]
+        if partitions:
+            consumer.pause(*partitions)
+        if not _backpressure_active:
+            logger.warning("Backpressure: consumo pausado.", extra={"batch_size": _get_flow_controller().batch_size})
+            _backpressure_active = True
+    elif _backpressure_active:
+        partitions = [tp for tp in consumer.assignment() if tp not in busy]
+        if partitions:
+            consumer.resume(*partitions)
+        logger.info("Backpressure: consumo retomado.", extra={"batch_size": _get_flow_controller().batch_size})
+        _backpressure_active = False
+
+
+def _consume_stream(consumer: KafkaConsumer, logger: logging.Logger) -> None:
+    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
+    commit_every = int(_get_env("KAFKA_BATCH_SIZE", "100") or 100)
+    while not _shutdown_requested:
+        # O iterador encerra apos KAFKA_POLL_TIMEOUT_MS sem mensagens (consumer_timeout_ms).
+        uncommitted = 0
+        for message in consumer:
+            _process_batch([message], logger)
+            _apply_backpressure(consumer, logger)
+            uncommitted += 1
+            if not auto_commit and uncommitted >= commit_every:
+                _commit_offsets(consumer, logger)
+                uncommitted = 0
+            if _shutdown_requested:
+                break
+        _run_due_retries(logger)
+        _collect_heavy(logger)
+        _record_usage([], logger)
+        _update_lag(consumer)
+        _apply_backpressure(consumer, logger)
+        if not auto_commit:
+            _commit_offsets(consumer, logger)
+
+
+def _consume_batches(consumer: KafkaConsumer, logger: logging.Logger) -> None:
+    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
+    poll_timeout_ms = int(_get_env("KAFKA_POLL_TIMEOUT_MS", "1000") or 1000)
+
+    while not _shutdown_requested:
+        records = consumer.poll(timeout_ms=poll_timeout_ms, max_records=_get_flow_controller().batch_size)
+        messages = [message for partition_messages in records.values() for message in partition_messages]
+        if messages or (_fair_scheduler is not None and len(_fair_scheduler) > 0):
+            _process_batch(messages, logger, fair=True)
+        _run_due_retries(logger)
+        _collect_heavy(logger)
+        _record_usage([], logger)
+        _update_lag(consumer)
+        _apply_backpressure(consumer, logger)
+        if not auto_commit:
+            _commit_offsets(consumer, logger)
+
 
+def _process_batch(messages: List[Any], logger: logging.Logger, fair: bool = False) -> None:
+    records = _to_records(messages)
+    metrics.count("messages", len(records))
+    # So o modo em lote agenda por tenant: no streaming cada ciclo tem uma mensagem.
+    scheduled = _schedule_fairly(records) if fair else records
+    fast = _dispatch_heavy(scheduled, logger)
+    started = time.monotonic()
+    usage, failures, timings, deletions = _process_records(fast)
+    _get_flow_controller().observe(len(fast), time.monotonic() - started, len(failures), timings["timings"])
+    metrics.merge(timings)
+    _defer_deletions(deletions)
+    _record_usage(usage, logger)
+    _schedule_retries(failures, 0, logger)
+    _mark_processed(records)
+    _record_tenant_lag(scheduled)
+    logger.info("Batch de eventos processado.", extra={"count": len(scheduled)})
 
-def _extract_correlation_id(message: Any) -> Optional[str]:
-    headers = getattr(message, "headers", None)
-    if not headers:
+
+def _get_fair_scheduler() -> Optional[TenantFairScheduler]:
+    global _fair_scheduler
+    enabled = (_get_env("TENANT_FAIRNESS_ENABLED", "true") or "true").lower() == "true"
+    if _fair_scheduler is None and enabled:
+        _fair_scheduler = TenantFairScheduler(
+            _message_tenant,
+            _message_partition,
+            weights=parse_tenant_map(_get_env("TENANT_WEIGHTS"), float),
+            quotas=parse_tenant_map(_get_env("TENANT_QUOTAS"), int),
+            default_quota=int(_get_env("TENANT_DEFAULT_QUOTA", "0") or 0),
+            backlog_max=int(_get_env("TENANT_BACKLOG_MAX", "5000") or 5000)
+        )
+    return _fair_scheduler
+
+
+def _schedule_fairly(records: List[LazyMessage]) -> List[LazyMessage]:
+    """Intercala o lote por tenant e adia o que passar da quota para o proximo ciclo.
+
+    Mensagens adiadas ja foram lidas do Kafka: o offset fica estacionado ate voltarem
+    a rodar, para que o commit nao passe delas.
+    """
+    scheduler = _get_fair_scheduler()
+    if scheduler is None:
+        return records
+    result = scheduler.schedule(records)
+    for message in result.resumed:
+        _release_offset(message)
+    for message in result.deferred:
+        if message.topic is not None and message.partition is not None and message.offset is not None:
+            _offset_tracker.park(TopicPartition(message.topic, message.partition), message.offset)
+    metrics.set_tenant_backlog(scheduler.backlog_by_tenant())
+    return result.run
+
+
+def _message_tenant(message: LazyMessage) -> str:
+    tenant_id = message.tenant_id
+    if tenant_id is None:
+        try:
+            tenant_id = (message.payload() or {}).get("tenant_id")
+        except Exception:
+            tenant_id = None
+    return str(tenant_id) if tenant_id else ""
+
+
+def _message_partition(message: LazyMessage) -> Optional[TopicPartition]:
+    if message.topic is None or message.partition is None:
         return None
-    for key, value in headers:
-        if key == "x-correlation-id":
-            try:
-                return value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else str(value)
-            except Exception:
-                return None
-    return None
+    return TopicPartition(message.topic, message.partition)
+
+
+def _record_tenant_lag(records: List[LazyMessage]) -> None:
+    """Idade da mensagem mais antiga de cada tenant no lote, pelo timestamp do Kafka."""
+    oldest: Dict[str, int] = {}
+    for message in records:
+        if message.timestamp is None or message.timestamp < 0:
+            continue
+        tenant = _message_tenant(message) or "unknown"
+        if tenant not in oldest or message.timestamp < oldest[tenant]:
+            oldest[tenant] = message.timestamp
+    now_ms = time.time() * 1000
+    metrics.set_tenant_lag({tenant: max(0.0, (now_ms - timestamp) / 1000) for tenant, timestamp in oldest.items()})
+
+
+def _get_heavy_lane() -> Optional[HeavyLane]:
+    global _heavy_lane
+    concurrency = int(_get_env("CLAIM_CHECK_LANE_CONCURRENCY", "2") or 2)
+    if _heavy_lane is None and concurrency > 0:
+        _heavy_lane = HeavyLane(
+            _process_heavy,
+            concurrency,
+            capacity=int(_get_env("CLAIM_CHECK_LANE_CAPACITY", str(concurrency * 2)) or concurrency * 2)
+        )
+    return _heavy_lane
+
+
+def _dispatch_heavy(records: List[LazyMessage], logger: logging.Logger) -> List[LazyMessage]:
+    """Envia claim-checks para a lane pesada e devolve os eventos da lane rapida.
+
+    A classificacao usa o header x-event-type, como o filtro de KAFKA_EVENT_TYPES: so
+    mensagens sem o header sao decodificadas aqui, e uma que nao decodifica e descartada
+    uma unica vez. O offset de cada claim-check fica estacionado ate a lane terminar,
+    entao o commit da particao nunca passa de uma mensagem pesada ainda em processamento.
+    """
+    lane = _get_heavy_lane()
+    if lane is None:
+        return records
+    event_types = _allowed_event_types()
+    fast: List[LazyMessage] = []
+    heavy: List[LazyMessage] = []
+    for message in records:
+        is_heavy = _is_claim_check(message, event_types, logger)
+        if is_heavy is None:
+            continue
+        (heavy if is_heavy else fast).append(message)
+    _submit_heavy(lane, [(message, 0) for message in heavy], event_types)
+    return fast
+
+
+def _is_claim_check(message: LazyMessage, event_types: Set[str], logger: logging.Logger) -> Optional[bool]:
+    """Se a mensagem vai para a lane pesada; None quando o payload nao decodifica."""
+    if message.event_type is not None:
+        if event_types and message.event_type not in event_types:
+            return False
+        return message.event_type == CLAIM_CHECK_EVENT_TYPE
+    try:
+        with metrics.timed("deserialize"):
+            payload = message.payload()
+    except Exception as exc:
+        logger.warning("Falha ao decodificar evento.", extra={"error": str(exc)})
+        return None
+    return _extract_claim_check(payload) is not None
+
+
+def _submit_heavy(lane: HeavyLane, items: List[Tuple[LazyMessage, int]], event_types: Set[str]) -> None:
+    """Estaciona o offset e entrega (mensagem, tentativas) a lane pesada."""
+    # Os downloads comecam antes do submit, que bloqueia com a lane cheia.
+    _prefetch_claim_checks([message for message, _ in items], event_types, minimum=1)
+    for message, attempts in items:
+        if message.topic is not None and message.partition is not None and message.offset is not None:
+            _offset_tracker.park(TopicPartition(message.topic, message.partition), message.offset)
+        lane.submit((message, attempts))
+
+
+def _process_heavy(
+    item: Tuple[LazyMessage, int]
+) -> Tuple[List[Dict[str, Any]], List[Tuple[LazyMessage, str]], List[DeleteTarget]]:
+    """Processa um claim-check em uma thread da lane pesada."""
+    message, _ = item
+    logger = logging.getLogger("telemetry-worker")
+    usage: List[Dict[str, Any]] = []
+    try:
+        error = _process_message(message, _allowed_event_types(), logger, usage)
+    finally:
+        # Download pre-carregado e nao lido (duplicado, falha antes da leitura).
+        if _prefetcher is not None and message.decoded:
+            claim = _extract_claim_check(message.payload())
+            if claim and claim.get("claim_check"):
+                _prefetcher.discard([_claim_check_object(claim)])
+    failures = [(message, error)] if error is not None else []
+    return usage, failures, storage_gc.take_requested()
+
+
+def _collect_heavy(logger: logging.Logger) -> None:
+    if _heavy_lane is None:
+        return
+    usage: List[Dict[str, Any]] = []
+    for (message, attempts), result in _heavy_lane.completed():
+        if isinstance(result, Exception):
+            result = ([], [(message, str(result))], [])
+        heavy_usage, failures, targets = result
+        usage.extend(heavy_usage)
+        if targets:
+            _defer_deletions([(message, targets)])
+        if failures:
+            # O offset continua estacionado ate o retry ou o dead-letter.
+            _schedule_retries(failures, attempts, logger)
+        else:
+            _release_offset(message)
+    _record_usage(usage, logger)
+
+
+def _run_due_retries(logger: logging.Logger) -> None:
+    """Reprocessa os retries vencidos; claim-checks voltam para a lane pesada, fora do poll."""
+    lane = _get_heavy_lane()
+    event_types = _allowed_event_types()
+    inline: List[RetryEntry] = []
+    heavy: List[Tuple[LazyMessage, int]] = []
+    for entry in _get_retry_scheduler().pop_due():
+        if lane is not None and _is_claim_check(entry.message, event_types, logger):
+            heavy.append((entry.message, entry.attempts))
+        else:
+            inline.append(entry)
+    if heavy:
+        _submit_heavy(lane, heavy, event_types)
+    for entry in inline:
+        usage, failures, timings, deletions = _process_records([entry.message])
+        metrics.merge(timings)
+        _defer_deletions(deletions)
+        _record_usage(usage, logger)
+        _finish_retry(entry, failures, logger)
 
 
-def _normalize_message(value: Any) -> Dict[str, Any]:
-    if isinstance(value, dict):
-        return value
-    return {"payload": value}
+def _finish_retry(entry: RetryEntry, failures: List[Tuple[LazyMessage, str]], logger: logging.Logger) -> None:
+    if failures:
+        _schedule_retries(failures, entry.attempts, logger)
+        return
+    _release_offset(entry.message)
+
+
+def _mark_processed(records: List[LazyMessage]) -> None:
+    """Avanca o offset commitavel de cada particao; falhas ja foram estacionadas."""
+    for message in records:
+        if message.topic is not None and message.partition is not None and message.offset is not None:
+            _offset_tracker.processed(TopicPartition(message.topic, message.partition), message.offset)
+
+
+def _release_offset(message: LazyMessage) -> None:
+    if message.topic is not None and message.partition is not None and message.offset is not None:
+        _offset_tracker.release(TopicPartition(message.topic, message.partition), message.offset)
 
 
-def _process_with_retries(payload: Dict[str, Any], logger: logging.Logger) -> None:
-    max_retries = int(_get_env("MAX_RETRIES", "3") or 3)
-    retry_delay = int(_get_env("RETRY_DELAY", "5") or 5)
-    batch_size = int(_get_env("BULK_INSERT_BATCH_SIZE", "1000") or 1000)
+def _commit_offsets(
+    consumer: KafkaConsumer,
+    logger: logging.Logger,
+    partitions: Optional[Iterable[TopicPartition]] = None,
+    sync: bool = False
+) -> None:
+    """Commita apenas offsets ja persistidos; assincrono no caminho normal, sincrono no revoke/shutdown.
 
-    attempt = 0
-    while True:
+    Com uso ainda no buffer do UsageAggregator, o commit para no ultimo offset coberto
+    por um flush: o claim de dedup ja e duravel, entao um crash depois de commitar alem
+    disso perderia a cobranca dessas mensagens.
+
+    Envios ao dead-letter sao conferidos antes: so os confirmados pelo broker liberam o offset.
+    """
+    _settle_dead_letters(logger)
+    if _get_usage_aggregator().pending():
+        offsets = _offset_tracker.commit_offsets(partitions, limit=_usage_covered)
+    else:
+        _usage_covered.update(_offset_tracker.committable())
+        offsets = _offset_tracker.commit_offsets(partitions)
+    if not offsets:
+        return
+    metadata = {tp: _offset_and_metadata(offset) for tp, offset in offsets.items()}
+    if sync:
         try:
-            _process_payload(payload, batch_size, logger)
+            consumer.commit(metadata)
+            _offset_tracker.mark_committed(offsets)
+            _get_deletion_queue().release(offsets)
+        except Exception as exc:
+            logger.warning("Falha ao commitar offsets.", extra={"error": str(exc)})
+        return
+
+    def _on_commit(_offsets: Any, response: Any) -> None:
+        if isinstance(response, Exception):
+            logger.warning("Falha ao commitar offsets.", extra={"error": str(response)})
             return
+        _offset_tracker.mark_committed(offsets)
+        _get_deletion_queue().release(offsets)
+
+    consumer.commit_async(metadata, callback=_on_commit)
+
+
+class _CommitOnRevoke(ConsumerRebalanceListener):
+    """Commit sincrono do que ja foi persistido antes de perder as particoes no rebalance."""
+
+    def __init__(self, consumer: KafkaConsumer, logger: logging.Logger) -> None:
+        self.consumer = consumer
+        self.logger = logger
+        self.auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
+
+    def on_partitions_revoked(self, revoked: Any) -> None:
+        if not self.auto_commit:
+            _flush_usage(self.logger)
+            _commit_offsets(self.consumer, self.logger, revoked, sync=True)
+        _offset_tracker.forget(revoked)
+        _forget_usage_coverage(revoked)
+        _forget_dead_letters(revoked)
+        _get_deletion_queue().forget(revoked)
+        if _fair_scheduler is not None:
+            _fair_scheduler.forget(revoked)
+
+    def on_partitions_lost(self, lost: Any) -> None:
+        # Membro expulso do grupo (sessao expirada): o commit falharia; so descarta o estado.
+        self.logger.warning("Particoes perdidas.", extra={"partitions": [tp.partition for tp in lost]})
+        _offset_tracker.forget(lost)
+        _forget_usage_coverage(lost)
+        _forget_dead_letters(lost)
+        _get_deletion_queue().forget(lost)
+        if _fair_scheduler is not None:
+            _fair_scheduler.forget(lost)
+
+    def on_partitions_assigned(self, assigned: Any) -> None:
+        self.logger.info("Particoes atribuidas.", extra={"partitions": [tp.partition for tp in assigned]})
+
+
+def _forget_usage_coverage(partitions: Iterable[TopicPartition]) -> None:
+    for tp in partitions:
+        _usage_covered.pop(tp, None)
+
+
+def _forget_dead_letters(partitions: Iterable[TopicPartition]) -> None:
+    """Particoes revogadas: quem assumir reprocessa os eventos ainda nao confirmados no dead-letter."""
+    revoked = set(partitions)
+
+    def _kept(entry: RetryEntry) -> bool:
+        return TopicPartition(entry.message.topic, entry.message.partition) not in revoked
+
+    _dead_letter_sends[:] = [(entry, future) for entry, future in _dead_letter_sends if _kept(entry)]
+    _dead_letter_failed[:] = [entry for entry in _dead_letter_failed if _kept(entry)]
+
+
+def _consume_partitions_parallel(consumer: KafkaConsumer, processes: int, logger: logging.Logger) -> None:
+    """Coordenador: um lote por particao em voo, processado em um processo do pool.
+
+    A particao fica pausada enquanto o lote esta em processamento, o que preserva a
+    ordem por particao e garante que o offset so e commitado apos o lote anterior. Um
+    lote que falha volta para o offset inicial e a particao fica pausada com backoff
+    exponencial (RETRY_DELAY ate RETRY_MAX_DELAY); se um processo filho morrer, o pool
+    e recriado no proximo envio.
+
+    O controle de fluxo e centralizado aqui: o tamanho do lote e decidido no poll e o
+    chunk de insert vai junto com cada lote. O cache de dedup em memoria e por processo
+    (uma particao pode cair em qualquer filho); a deduplicacao garantida continua sendo
+    a do banco.
+    """
+    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
+    poll_timeout_ms = int(_get_env("KAFKA_POLL_TIMEOUT_MS", "1000") or 1000)
+    in_flight: Dict[TopicPartition, Tuple[Future, int, int, float]] = {}
+    retries_in_flight: List[Tuple[Future, RetryEntry]] = []
+    logger.info("Processamento paralelo por particao habilitado.", extra={"processes": processes})
+
+    while not _shutdown_requested:
+        records = consumer.poll(
+            timeout_ms=100 if in_flight else poll_timeout_ms,
+            max_records=_get_flow_controller().batch_size
+        )
+        for tp, messages in records.items():
+            if tp in in_flight:
+                consumer.seek(tp, messages[0].offset)
+                consumer.pause(tp)
+                continue
+            future = _submit_to_pool(_to_records(messages), logger)
+            in_flight[tp] = (future, messages[0].offset, messages[-1].offset, time.monotonic())
+            metrics.count("messages", len(messages))
+            consumer.pause(tp)
+        for entry in _get_retry_scheduler().pop_due():
+            retries_in_flight.append((_submit_to_pool([entry.message], logger), entry))
+        _collect_partition_results(consumer, in_flight, auto_commit, logger)
+        retries_in_flight = _collect_retry_results(retries_in_flight, logger)
+        _resume_backed_off(consumer, in_flight)
+        _update_lag(consumer)
+        _apply_backpressure(consumer, logger, busy=set(in_flight) | _backed_off())
+
+    wait([future for future, _, _, _ in in_flight.values()] + [future for future, _ in retries_in_flight])
+    _collect_partition_results(consumer, in_flight, auto_commit, logger)
+    _collect_retry_results(retries_in_flight, logger)
+    if _process_pool is not None:
+        _process_pool.shutdown()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=int(_get_env("WORKER_PROCESSES", "1") or 1),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_setup_logger
+        )
+    return _process_pool
+
+
+def _submit_to_pool(records: List[LazyMessage], logger: logging.Logger) -> Future:
+    """Envia o lote ao pool; um pool quebrado (filho morto) e descartado e recriado."""
+    global _process_pool
+    chunk_size = _get_flow_controller().chunk_size
+    try:
+        return _get_process_pool().submit(_process_records, records, chunk_size)
+    except BrokenProcessPool:
+        logger.warning("Pool de processos quebrado; recriando.")
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False)
+        _process_pool = None
+        return _get_process_pool().submit(_process_records, records, chunk_size)
+
+
+def _back_off_partition(tp: TopicPartition) -> float:
+    scheduler = _get_retry_scheduler()
+    failures = _partition_backoff.get(tp, (0, 0.0))[0] + 1
+    delay = min(scheduler.max_delay, scheduler.base_delay * (2 ** (failures - 1)))
+    _partition_backoff[tp] = (failures, time.monotonic() + delay)
+    return delay
+
+
+def _backed_off() -> Set[TopicPartition]:
+    return {tp for tp, (_, resume_at) in _partition_backoff.items() if resume_at > 0}
+
+
+def _resume_backed_off(consumer: KafkaConsumer, in_flight: Dict[TopicPartition, Any]) -> None:
+    now = time.monotonic()
+    assigned = consumer.assignment()
+    for tp, (failures, resume_at) in list(_partition_backoff.items()):
+        if tp not in assigned:
+            del _partition_backoff[tp]
+        elif 0 < resume_at <= now and tp not in in_flight:
+            # A contagem de falhas so zera quando o lote passar.
+            _partition_backoff[tp] = (failures, 0.0)
+            if not _get_flow_controller().should_pause():
+                consumer.resume(tp)
+
+
+def _collect_partition_results(
+    consumer: KafkaConsumer,
+    in_flight: Dict[TopicPartition, Tuple[Future, int, int, float]],
+    auto_commit: bool,
+    logger: logging.Logger
+) -> None:
+    done = [tp for tp, (future, _, _, _) in in_flight.items() if future.done()]
+    if not done:
+        _record_usage([], logger)
+        return
+
+    assigned = consumer.assignment()
+    usage: List[Dict[str, Any]] = []
+    for tp in done:
+        future, first_offset, last_offset, submitted_at = in_flight.pop(tp)
+        if tp not in assigned:
+            continue
+        try:
+            partition_usage, failures, timings, deletions = future.result()
+            _get_flow_controller().observe(
+                last_offset - first_offset + 1, time.monotonic() - submitted_at, len(failures), timings["timings"]
+            )
+            metrics.merge(timings)
+            _defer_deletions(deletions)
+            usage.extend(partition_usage)
+            _schedule_retries(failures, 0, logger)
+            _offset_tracker.processed(tp, last_offset)
+            _partition_backoff.pop(tp, None)
+        except Exception as exc:
+            delay = _back_off_partition(tp)
+            logger.warning(
+                "Falha no processamento da particao; lote sera reconsumido.",
+                extra={"error": str(exc), "partition": tp.partition, "retry_in": delay}
+            )
+            consumer.seek(tp, first_offset)
+            continue
+        if not _get_flow_controller().should_pause():
+            consumer.resume(tp)
+
+    _record_usage(usage, logger)
+    if not auto_commit:
+        _commit_offsets(consumer, logger)
+
+
+def _collect_retry_results(
+    retries_in_flight: List[Tuple[Future, RetryEntry]],
+    logger: logging.Logger
+) -> List[Tuple[Future, RetryEntry]]:
+    remaining: List[Tuple[Future, RetryEntry]] = []
+    usage: List[Dict[str, Any]] = []
+    for future, entry in retries_in_flight:
+        if not future.done():
+            remaining.append((future, entry))
+            continue
+        try:
+            retry_usage, failures, timings, deletions = future.result()
+            metrics.merge(timings)
+            _defer_deletions(deletions)
+        except Exception as exc:
+            retry_usage, failures = [], [(entry.message, str(exc))]
+        usage.extend(retry_usage)
+        _finish_retry(entry, failures, logger)
+    _record_usage(usage, logger)
+    return remaining
+
+
+def _install_signal_handlers(logger: logging.Logger) -> None:
+    def _request_shutdown(signum: int, _frame: Any) -> None:
+        global _shutdown_requested
+        _shutdown_requested = True
+        logger.info("Encerramento solicitado.", extra={"signal": signum})
+
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    signal.signal(signal.SIGINT, _request_shutdown)
+
+
+def _shutdown(consumer: KafkaConsumer, logger: logging.Logger) -> None:
+    """Flush final das metricas de uso antes do ultimo commit de offsets."""
+    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
+    if _heavy_lane is not None:
+        _heavy_lane.close()
+        _collect_heavy(logger)
+    # Retries pendentes nao sobrevivem ao processo: seguem para o dead-letter.
+    parked = _get_retry_scheduler().pending()
+    if parked:
+        logger.warning("Encerrando com eventos aguardando retry.", extra={"count": len(parked)})
+    for entry in parked:
+        _dead_letter(entry.message, entry.attempts, entry.error, logger)
+    # Se o flush falhar, o commit final para no ultimo offset com uso gravado.
+    _flush_usage(logger)
+    if not auto_commit:
+        _commit_offsets(consumer, logger, sync=True)
+    if _dead_letter_sends or _dead_letter_failed:
+        logger.warning(
+            "Encerrando com envios ao dead-letter nao confirmados; os offsets nao foram commitados.",
+            extra={"count": len(_dead_letter_sends) + len(_dead_letter_failed)}
+        )
+    try:
+        dead_letter.flush()
+        dead_letter.close()
+    except Exception as exc:
+        logger.warning("Falha ao fechar producer do dead-letter.", extra={"error": str(exc)})
+    if _deletion_queue is not None:
+        _deletion_queue.close()
+    if _retention is not None:
+        _retention.stop()
+    for pool in db.all_pools().values():
+        pool.close()
+    consumer.close(autocommit=False)
+    logger.info("Telemetry consumer stopped.")
+
+
+def _offset_and_metadata(offset: int) -> OffsetAndMetadata:
+    if "leader_epoch" in OffsetAndMetadata._fields:
+        return OffsetAndMetadata(offset, "", -1)
+    return OffsetAndMetadata(offset, "")
+
+
+def _to_records(messages: List[Any]) -> List[LazyMessage]:
+    return [LazyMessage.from_record(message) for message in messages]
+
+
+def _process_records(
+    records: List[LazyMessage],
+    chunk_size: Optional[int] = None
+) -> Tuple[
+    List[Dict[str, Any]],
+    List[Tuple[LazyMessage, str]],
+    Dict[str, Any],
+    List[Tuple[LazyMessage, List[DeleteTarget]]]
+]:
+    """Processa registros em ordem; executa no processo principal ou em um worker do pool.
+
+    Retorna as metricas de uso, as mensagens que falharam (com o erro), que o chamador
+    agenda no RetryScheduler em vez de bloquear o consumo, o snapshot de latencias do
+    processo para o endpoint de metricas e os arquivos a remover por mensagem, que o
+    processo principal so apaga depois do commit do offset.
+
+    `chunk_size` vem do controle de fluxo do processo principal quando o lote roda no
+    pool, para que os filhos usem o mesmo chunk de insert.
+    """
+    logger = logging.getLogger("telemetry-worker")
+    if chunk_size is not None:
+        _get_flow_controller().chunk_size = chunk_size
+    event_types = _allowed_event_types()
+    usage: List[Dict[str, Any]] = []
+    failures: List[Tuple[LazyMessage, str]] = []
+    deletions: List[Tuple[LazyMessage, List[DeleteTarget]]] = []
+    prefetched = _prefetch_claim_checks(records, event_types)
+    try:
+        _grouped_results.update(_persist_inline_groups(records, event_types, logger))
+        for message in records:
+            error = _process_message(message, event_types, logger, usage)
+            if error is not None:
+                failures.append((message, error))
+            targets = storage_gc.take_requested()
+            if targets:
+                deletions.append((message, targets))
+    finally:
+        _grouped_results.clear()
+        if prefetched:
+            _get_prefetcher().discard(prefetched)
+    return usage, failures, metrics.drain(), deletions
+
+
+def _persist_inline_groups(
+    records: List[LazyMessage],
+    event_types: Set[str],
+    logger: logging.Logger
+) -> Dict[str, Optional[int]]:
+    """Grava os eventos inline do lote agrupados por banco: uma transacao e um COPY por destino.
+
+    Claim-checks ficam de fora (seguem em streaming, um a um). Se a gravacao de um grupo
+    falhar, seus eventos seguem pelo caminho individual, que isola o evento com erro.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    grouped_ids: Set[str] = set()
+    for message in records:
+        if event_types and message.event_type is not None and message.event_type not in event_types:
+            continue
+        try:
+            with metrics.timed("deserialize"):
+                payload = message.payload()
+        except Exception:
+            continue
+        if event_types and message.event_type is None and payload.get("event_type") not in event_types:
+            continue
+        event_id = payload.get("event_id")
+        if not event_id or str(event_id) in grouped_ids or _extract_claim_check(payload):
+            continue
+        if _get_recent_events().seen(event_id):
+            continue
+        try:
+            dsn = _telemetry_dsn(payload.get("tenant_id"))
+        except Exception:
+            continue
+        groups.setdefault(dsn, []).append(payload)
+        grouped_ids.add(str(event_id))
+
+    results: Dict[str, Optional[int]] = {}
+    batch_size = _get_flow_controller().chunk_size
+    for dsn, payloads in groups.items():
+        if len(payloads) < 2:
+            continue
+        try:
+            results.update(_persist_group(dsn, payloads, batch_size))
         except Exception as exc:
-            attempt += 1
-            if attempt > max_retries:
-                logger.warning("Falha ao processar evento.", extra={"error": str(exc)})
-                return
-            time.sleep(retry_delay)
+            logger.warning(
+                "Falha na gravacao agrupada; eventos seguem individualmente.",
+                extra={"error": str(exc), "count": len(payloads)}
+            )
+    return results
+
+
+def _persist_group(dsn: str, payloads: List[Dict[str, Any]], batch_size: int) -> Dict[str, Optional[int]]:
+    results: Dict[str, Optional[int]] = {}
+    with _get_pool_for_dsn(dsn).connection() as conn:
+        try:
+            started = time.perf_counter()
+            rows: List[Any] = []
+            for payload in payloads:
+                event_id = str(payload.get("event_id"))
+                if not claim_event(conn, payload):
+                    results[event_id] = None
+                    continue
+                items = payload.get("items")
+                items = items if isinstance(items, list) else []
+                rows.extend(build_item_rows(items, payload))
+                results[event_id] = len(items)
+            for start in range(0, len(rows), batch_size):
+                copy_rows(conn, rows[start : start + batch_size])
+            conn.commit()
+            metrics.record("persist", time.perf_counter() - started)
+        except Exception:
+            conn.rollback()
+            raise
+    return results
+
+
+def _defer_deletions(deletions: List[Tuple[LazyMessage, List[DeleteTarget]]]) -> None:
+    """Agenda as remocoes para depois do commit do offset de cada mensagem."""
+    auto_commit = (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true"
+    queue = _get_deletion_queue()
+    for message, targets in deletions:
+        if auto_commit or message.topic is None or message.partition is None or message.offset is None:
+            # Sem commit manual nao ha como saber quando o offset foi confirmado.
+            queue.submit(targets)
+            continue
+        queue.defer(TopicPartition(message.topic, message.partition), message.offset, targets)
+
+
+def _get_deletion_queue() -> DeletionQueue:
+    global _deletion_queue
+    if _deletion_queue is None:
+        _deletion_queue = DeletionQueue(
+            _remove_storage_objects,
+            batch_size=int(_get_env("STORAGE_DELETE_BATCH_SIZE", "500") or 500),
+            flush_interval=float(_get_env("STORAGE_DELETE_FLUSH_SECONDS", "5") or 5)
+        )
+    return _deletion_queue
+
+
+def _prefetch_claim_checks(
+    records: List[LazyMessage],
+    event_types: Set[str],
+    minimum: int = 2
+) -> List[Tuple[str, str]]:
+    """Dispara o download dos claim-checks do lote antes de processar a primeira mensagem.
+
+    A lane pesada usa `minimum=1`: mesmo um claim-check sozinho espera por uma thread
+    livre da lane, e o download ja pode ir adiantando.
+    """
+    if len(records) < minimum or int(_get_env("CLAIM_CHECK_PREFETCH_WORKERS", "4") or 4) <= 0:
+        return []
+    keys: List[Tuple[str, str]] = []
+    for message in records:
+        prefetch = _claim_check_prefetch(message, event_types)
+        if prefetch is None:
+            continue
+        key, size = prefetch
+        if _get_prefetcher().prefetch(key, size):
+            keys.append(key)
+    return keys
+
+
+def _claim_check_prefetch(message: LazyMessage, event_types: Set[str]) -> Optional[Tuple[Tuple[str, str], int]]:
+    """Chave (bucket, objeto) e tamanho do claim-check da mensagem, se valer pre-carregar."""
+    if event_types and message.event_type is not None and message.event_type not in event_types:
+        return None
+    try:
+        payload = message.payload()
+    except Exception:
+        return None
+    claim = _extract_claim_check(payload)
+    if not claim or not claim.get("claim_check") or _get_recent_events().seen(payload.get("event_id")):
+        return None
+    if (claim.get("storage_type") or _get_env("STORAGE_TYPE", "minio")).lower() == "local":
+        return None
+    return _claim_check_object(claim), int(claim.get("file_size") or 0)
+
+
+def _claim_check_object(claim: Dict[str, Any]) -> Tuple[str, str]:
+    return claim.get("bucket") or _get_env("MINIO_BUCKET", "telemetry-raw"), claim["claim_check"]
+
+
+def _get_prefetcher() -> ClaimCheckPrefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = ClaimCheckPrefetcher(
+            _fetch_claim_check_object,
+            max_workers=int(_get_env("CLAIM_CHECK_PREFETCH_WORKERS", "4") or 4),
+            memory_budget=int(_get_env("CLAIM_CHECK_PREFETCH_MEMORY_MB", "256") or 256) * 1024 * 1024
+        )
+    return _prefetcher
+
+
+def _fetch_claim_check_object(key: Tuple[str, str]) -> bytes:
+    client = _get_minio_client()
+    if not client:
+        raise RuntimeError("MinIO nao configurado.")
+    bucket, object_name = key
+    started = time.perf_counter()
+    response = client.get_object(bucket, object_name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+        metrics.record("claim_check_fetch", time.perf_counter() - started)
+
+
+def _process_message(
+    message: LazyMessage,
+    event_types: Set[str],
+    logger: logging.Logger,
+    usage: Optional[List[Dict[str, Any]]] = None
+) -> Optional[str]:
+    # Roteamento pelo header: eventos fora da lista nao chegam a ser decodificados.
+    if event_types and message.event_type is not None and message.event_type not in event_types:
+        return None
+    try:
+        if message.decoded:
+            payload = message.payload()
+        else:
+            with metrics.timed("deserialize"):
+                payload = message.payload()
+    except Exception as exc:
+        logger.warning("Falha ao decodificar evento.", extra={"error": str(exc)})
+        return None
+    if event_types and message.event_type is None and payload.get("event_type") not in event_types:
+        return None
+
+    event_id = payload.get("event_id")
+    if _get_recent_events().seen(event_id):
+        metrics.count("duplicate")
+        logger.info("Evento duplicado ignorado.", extra={"correlation_id": message.correlation_id, "event_id": event_id})
+        return None
+
+    if logs.should_log_event(logger):
+        logger.info(
+            "Telemetry event received.",
+            extra={"correlation_id": message.correlation_id, "data": logs.payload_for_log(payload)}
+        )
+    error = _process_attempt(payload, logger, usage, message.size)
+    if error is None:
+        _get_recent_events().add(event_id)
+    return error
+
+
+def _get_recent_events() -> RecentEventIds:
+    global _recent_events
+    if _recent_events is None:
+        _recent_events = RecentEventIds(int(_get_env("DEDUP_CACHE_SIZE", "100000") or 100000))
+    return _recent_events
+
+
+def _allowed_event_types() -> Set[str]:
+    raw = _get_env("KAFKA_EVENT_TYPES", "") or ""
+    return {event_type.strip() for event_type in raw.split(",") if event_type.strip()}
+
+
+def _process_attempt(
+    payload: Dict[str, Any],
+    logger: logging.Logger,
+    usage: Optional[List[Dict[str, Any]]] = None,
+    payload_bytes: Optional[int] = None
+) -> Optional[str]:
+    """Uma tentativa de processamento; retorna o erro em caso de falha (sem sleep)."""
+    batch_size = _get_flow_controller().chunk_size
+    attempt_usage: Optional[List[Dict[str, Any]]] = [] if usage is not None else None
+    try:
+        _process_payload(payload, batch_size, logger, attempt_usage, payload_bytes)
+    except Exception as exc:
+        return str(exc)
+    if usage is not None and attempt_usage:
+        usage.extend(attempt_usage)
+    return None
+
+
+def _get_retry_scheduler() -> RetryScheduler:
+    global _retry_scheduler
+    if _retry_scheduler is None:
+        _retry_scheduler = RetryScheduler(
+            max_retries=int(_get_env("MAX_RETRIES", "3") or 3),
+            base_delay=float(_get_env("RETRY_DELAY", "5") or 5),
+            max_delay=float(_get_env("RETRY_MAX_DELAY", "300") or 300),
+            capacity=int(_get_env("RETRY_QUEUE_SIZE", "10000") or 10000)
+        )
+    return _retry_scheduler
+
+
+def _schedule_retries(failures: List[Tuple[LazyMessage, str]], attempts: int, logger: logging.Logger) -> None:
+    scheduler = _get_retry_scheduler()
+    for message, error in failures:
+        if message.topic is not None and message.partition is not None and message.offset is not None:
+            _offset_tracker.park(TopicPartition(message.topic, message.partition), message.offset)
+        if scheduler.schedule(message, attempts + 1, error):
+            metrics.count("retry_scheduled")
+            logger.info(
+                "Evento agendado para retry.",
+                extra={"correlation_id": message.correlation_id, "attempt": attempts + 1, "error": error}
+            )
+            continue
+        _dead_letter(message, attempts + 1, error, logger)
+
+
+def _dead_letter(message: LazyMessage, attempts: int, error: str, logger: logging.Logger) -> None:
+    metrics.count("dead_lettered")
+    future = dead_letter.publish(message, error, attempts, logger)
+    if future is None or (_get_env("KAFKA_AUTO_COMMIT", "false") or "false").lower() == "true":
+        _release_offset(message)
+        return
+    # O offset segue estacionado ate o broker confirmar o envio (_settle_dead_letters).
+    _dead_letter_sends.append((RetryEntry(message=message, attempts=attempts, error=error, due_at=0.0), future))
+
+
+def _settle_dead_letters(logger: logging.Logger) -> None:
+    """Libera os offsets dos envios ao dead-letter confirmados; os que falharam sao republicados.
+
+    Um envio que falhou (topico inexistente, broker fora) mantem o offset estacionado e
+    volta a ser publicado depois de RETRY_MAX_DELAY, entao o evento nunca e perdido.
+    """
+    now = time.monotonic()
+    due = [entry for entry in _dead_letter_failed if entry.due_at <= now]
+    if due:
+        _dead_letter_failed[:] = [entry for entry in _dead_letter_failed if entry.due_at > now]
+        for entry in due:
+            _dead_letter(entry.message, entry.attempts, entry.error, logger)
+    if not _dead_letter_sends:
+        return
+    try:
+        dead_letter.flush()
+    except Exception as exc:
+        logger.warning("Falha no flush do dead-letter.", extra={"error": str(exc)})
+    pending: List[Tuple[RetryEntry, Any]] = []
+    for entry, future in _dead_letter_sends:
+        if not future.is_done:
+            pending.append((entry, future))
+        elif future.succeeded():
+            _release_offset(entry.message)
+        else:
+            metrics.count("dead_letter_failed")
+            entry.due_at = now + _get_retry_scheduler().max_delay
+            _dead_letter_failed.append(entry)
+    _dead_letter_sends[:] = pending
 
 
-def _process_payload(payload: Dict[str, Any], batch_size: int, logger: logging.Logger) -> None:
+def _process_payload(
+    payload: Dict[str, Any],
+    batch_size: int,
+    logger: logging.Logger,
+    usage: Optional[List[Dict[str, Any]]] = None,
+    payload_bytes: Optional[int] = None
+) -> None:
     claim = _extract_claim_check(payload)
     if claim:
-        payload = _load_claim_check_payload(claim, logger)
+        _process_claim_check(payload, claim, batch_size, logger, usage)
+        return
 
     items = payload.get("items")
+    if isinstance(items, list) or payload.get("event_id"):
+        persisted = _persist_items(items if isinstance(items, list) else [], payload, batch_size, logger)
+        if persisted is None:
+            logger.info("Evento ja ingerido; ignorado.", extra={"event_id": payload.get("event_id")})
+            return
     if isinstance(items, list):
-        for i in range(0, len(items), batch_size):
-            batch = items[i : i + batch_size]
-            logger.info("Processando batch", extra={"count": len(batch)})
-        _emit_usage_metrics(payload, len(items))
+        _emit_usage_metrics(payload, len(items), usage, payload_bytes)
         _handle_files(payload, logger, claim)
-        _cleanup_storage(logger)
         return
     logger.info("Processando evento unitario.")
-    _emit_usage_metrics(payload, 1)
+    _emit_usage_metrics(payload, 1, usage, payload_bytes)
     _handle_files(payload, logger, claim)
-    _cleanup_storage(logger)
 
 
-def _emit_usage_metrics(payload: Dict[str, Any], event_count: int) -> None:
+def _process_claim_check(
+    envelope: Dict[str, Any],
+    claim: Dict[str, Any],
+    batch_size: int,
+    logger: logging.Logger,
+    usage: Optional[List[Dict[str, Any]]] = None
+) -> None:
+    item_count: Optional[int] = 0
+    payload_bytes = int(claim.get("original_size") or 0)
+    with _open_claim_check_stream(claim, logger) as stream:
+        if stream is not None:
+            item_count = _persist_items(_iter_json_items(stream), envelope, batch_size, logger)
+            payload_bytes = payload_bytes or stream.tell()
+
+    if item_count is None:
+        # Reentrega de evento ja ingerido: apenas remove o arquivo, se ainda existir.
+        logger.info("Evento ja ingerido; ignorado.", extra={"event_id": envelope.get("event_id")})
+        _handle_files(envelope, logger, claim)
+        return
+    if item_count == 0:
+        logger.info("Processando evento unitario.")
+    _emit_usage_metrics(envelope, item_count or 1, usage, payload_bytes)
+    _handle_files(envelope, logger, claim)
+
+
+def _persist_items(
+    items: Iterable[Any],
+    envelope: Dict[str, Any],
+    batch_size: int,
+    logger: logging.Logger
+) -> Optional[int]:
+    """Grava os itens em uma transacao; None se o event_id ja havia sido ingerido."""
+    event_id = envelope.get("event_id")
+    if event_id is not None and str(event_id) in _grouped_results:
+        return _grouped_results.pop(str(event_id))
+    total = 0
+    with _get_telemetry_db_pool(envelope.get("tenant_id")).connection() as conn:
+        try:
+            # O claim vem antes da leitura: no claim-check, duplicatas nao leem o arquivo.
+            if not claim_event(conn, envelope):
+                conn.rollback()
+                return None
+            iterator = iter(items)
+            batch = list(islice(iterator, batch_size))
+            # A leitura dos itens (claim-check) fica fora do tempo de persistencia.
+            persist_elapsed = 0.0
+            while batch:
+                started = time.perf_counter()
+                copy_rows(conn, build_item_rows(batch, envelope, total))
+                persist_elapsed += time.perf_counter() - started
+                total += len(batch)
+                logger.debug("Batch persistido.", extra={"count": len(batch)})
+                batch = list(islice(iterator, batch_size))
+            started = time.perf_counter()
+            conn.commit()
+            metrics.record("persist", persist_elapsed + time.perf_counter() - started)
+        except Exception:
+            conn.rollback()
+            raise
+    return total
+
+
+def _emit_usage_metrics(
+    payload: Dict[str, Any],
+    event_count: int,
+    usage: Optional[List[Dict[str, Any]]] = None,
+    payload_bytes: Optional[int] = None
+) -> None:
     if (_get_env("BILLING_USAGE_ENABLED", "false") or "false").lower() != "true":
         return
     tenant_id = payload.get("tenant_id")
@@ -189,7 +1257,7 @@ def _emit_usage_metrics(payload: Dict[str, Any], event_count: int) -> None:
         return
 
     period = datetime.utcnow().strftime("%Y-%m")
-    bytes_count = len(json.dumps(payload).encode("utf-8"))
+    bytes_count = payload_bytes if payload_bytes is not None else len(codec.dumps(payload))
     metrics = [
         {
             "tenant_id": tenant_id,
@@ -206,42 +1274,97 @@ def _emit_usage_metrics(payload: Dict[str, Any], event_count: int) -> None:
             "source": "worker"
         }
     ]
+    if usage is not None:
+        usage.extend(metrics)
+        return
+    _get_usage_aggregator().add(metrics)
+
+
+def _get_usage_aggregator() -> UsageAggregator:
+    global _usage_aggregator
+    if _usage_aggregator is None:
+        _usage_aggregator = UsageAggregator(
+            _write_usage_metrics,
+            max_keys=int(_get_env("USAGE_FLUSH_MAX_KEYS", "1000") or 1000),
+            flush_interval=float(_get_env("USAGE_FLUSH_INTERVAL_SECONDS", "10") or 10)
+        )
+    return _usage_aggregator
+
+
+def _record_usage(usage: List[Dict[str, Any]], logger: logging.Logger) -> None:
+    aggregator = _get_usage_aggregator()
+    if usage:
+        aggregator.add(usage)
+    if aggregator.should_flush():
+        _flush_usage(logger)
+    metrics.merge(metrics.drain())
+
+
+def _flush_usage(logger: logging.Logger) -> bool:
+    """Grava o buffer de uso e registra os offsets que ele cobre; False se o flush falhou."""
+    aggregator = _get_usage_aggregator()
+    covered = _offset_tracker.committable()
+    try:
+        aggregator.flush()
+    except Exception as exc:
+        logger.warning(
+            "Falha ao gravar metricas de uso; mantidas no buffer.",
+            extra={"error": str(exc), "pending": aggregator.pending()}
+        )
+        return False
+    _usage_covered.update(covered)
+    return True
+
+
+def _write_usage_metrics(usage_metrics: List[Dict[str, Any]]) -> None:
+    if not usage_metrics:
+        return
+    with metrics.timed("usage_emit"):
+        _send_usage_metrics(usage_metrics)
 
+
+def _send_usage_metrics(metrics: List[Dict[str, Any]]) -> None:
     base_url = _get_env("INTERNAL_API_BASE_URL")
     token = _get_env("SERVICE_TOKEN")
     if base_url and token:
-        requests.post(
+        response = http_client.post(
             f"{base_url}/internal/usage/metrics",
             json={"metrics": metrics},
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=5
+            headers={"Authorization": f"Bearer {token}"}
         )
+        response.raise_for_status()
         return
 
-    pool = _get_db_pool()
-    if not pool:
-        return
-    conn = pool.getconn()
-    try:
-        with conn.cursor() as cursor:
-            for metric in metrics:
-                cursor.execute(
+    with _get_db_pool().connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                # tenant_id das metricas e o uuid do tenant; resolve para tenants.id no proprio INSERT.
+                execute_values(
+                    cursor,
                     """
                     INSERT INTO tenant_usage_metrics
-                    (id, tenant_id, metric_key, metric_value, period, source, created_at)
-                    VALUES (gen_random_uuid(), %s, %s, %s, %s, %s, now())
+                    (tenant_id, metric_key, metric_value, period, source, created_at)
+                    SELECT t.id, v.metric_key, v.metric_value, v.period, v.source, now()
+                    FROM (VALUES %s) AS v (tenant_uuid, metric_key, metric_value, period, source)
+                    JOIN tenants t ON t.uuid::text = v.tenant_uuid
                     """,
                     [
-                        metric["tenant_id"],
-                        metric["metric_key"],
-                        metric["metric_value"],
-                        metric["period"],
-                        metric["source"]
-                    ]
+                        (
+                            str(metric["tenant_id"]),
+                            metric["metric_key"],
+                            metric["metric_value"],
+                            metric["period"],
+                            metric["source"]
+                        )
+                        for metric in metrics
+                    ],
+                    template="(%s, %s, %s::bigint, %s, %s)",
+                    page_size=len(metrics)
                 )
-        conn.commit()
-    finally:
-        pool.putconn(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 
 def _handle_files(payload: Dict[str, Any], logger: logging.Logger, claim: Optional[Dict[str, Any]]) -> None:
@@ -258,37 +1381,33 @@ def _handle_files(payload: Dict[str, Any], logger: logging.Logger, claim: Option
     if isinstance(file_paths, list):
         paths.extend([path for path in file_paths if isinstance(path, str)])
     for path in paths:
-        try:
-            os.remove(path)
-        except FileNotFoundError:
-            continue
-        except Exception as exc:
-            logger.warning("Falha ao remover arquivo.", extra={"error": str(exc), "path": path})
+        storage_gc.request(("file", "", path))
 
 
-def _cleanup_storage(logger: logging.Logger) -> None:
-    global _last_cleanup_at
+def _start_retention(logger: logging.Logger) -> None:
+    """Retencao do storage (FILE_RETENTION_DAYS) em uma thread, fora do loop de consumo."""
+    global _retention
     retention_days = int(_get_env("FILE_RETENTION_DAYS", "0") or 0)
     if retention_days <= 0:
         return
-    now = time.time()
-    if now - _last_cleanup_at < 3600:
-        return
-    _last_cleanup_at = now
-
     base_path = _get_env("STORAGE_LOCAL_PATH")
-    if not base_path:
-        return
-
-    cutoff = now - retention_days * 86400
-    for root, _, files in os.walk(base_path):
-        for filename in files:
-            file_path = os.path.join(root, filename)
-            try:
-                if os.path.getmtime(file_path) < cutoff:
-                    os.remove(file_path)
-            except Exception as exc:
-                logger.warning("Falha ao limpar arquivo antigo.", extra={"error": str(exc), "path": file_path})
+    cursor_path = _get_env("STORAGE_RETENTION_CURSOR_PATH")
+    if not cursor_path and base_path:
+        cursor_path = os.path.join(base_path, ".retention-cursor.json")
+    _retention = RetentionEngine(
+        retention_days,
+        base_path,
+        logger,
+        interval=float(_get_env("STORAGE_RETENTION_INTERVAL_SECONDS", "3600") or 3600),
+        slice_seconds=int(_get_env("STORAGE_RETENTION_SLICE_MS", "200") or 200) / 1000,
+        pause_seconds=int(_get_env("STORAGE_RETENTION_PAUSE_MS", "1000") or 1000) / 1000,
+        cursor_path=cursor_path,
+        minio_client=_get_minio_client(),
+        bucket=_get_env("MINIO_BUCKET", "telemetry-raw"),
+        minio_mode=(_get_env("MINIO_RETENTION_MODE", "off") or "off").lower(),
+        minio_prefix=_get_env("MINIO_RETENTION_PREFIX", "telemetry/") or ""
+    )
+    _retention.start()
 
 
 def _extract_claim_check(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -299,24 +1418,78 @@ def _extract_claim_check(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     return None
 
 
-def _load_claim_check_payload(claim: Dict[str, Any], logger: logging.Logger) -> Dict[str, Any]:
+@contextmanager
+def _open_claim_check_stream(claim: Dict[str, Any], logger: logging.Logger) -> Iterator[Optional[IO[bytes]]]:
     storage_type = (claim.get("storage_type") or _get_env("STORAGE_TYPE", "minio")).lower()
+    key = claim.get("claim_check")
     if storage_type == "local":
-        key = claim.get("claim_check")
         if not key:
-            return {}
-        return _read_gzip_json(os.path.join(_get_env("STORAGE_LOCAL_PATH", ""), key), logger)
+            yield None
+            return
+        path = os.path.join(_get_env("STORAGE_LOCAL_PATH", ""), key)
+        try:
+            handle = gzip.open(path, "rb")
+        except Exception as exc:
+            logger.warning("Falha ao ler payload local.", extra={"error": str(exc), "path": path})
+            yield None
+            return
+        decompressed = _TimedReader(handle)
+        with handle:
+            yield decompressed
+        metrics.record("gunzip", decompressed.elapsed)
+        return
 
     client = _get_minio_client()
     bucket = claim.get("bucket") or _get_env("MINIO_BUCKET", "telemetry-raw")
-    key = claim.get("claim_check")
     if not client or not key:
-        return {}
+        yield None
+        return
+    data = _get_prefetcher().take((bucket, key)) if _prefetcher is not None else None
+    if data is not None:
+        with gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb") as handle:
+            decompressed = _TimedReader(handle)
+            yield decompressed
+        metrics.record("gunzip", decompressed.elapsed)
+        return
+    started = time.perf_counter()
     response = client.get_object(bucket, key)
-    data = response.read()
-    response.close()
-    response.release_conn()
-    return _gunzip_json_bytes(data, logger)
+    open_elapsed = time.perf_counter() - started
+    raw = _TimedReader(response)
+    decompressed = None
+    try:
+        with gzip.GzipFile(fileobj=raw, mode="rb") as handle:
+            decompressed = _TimedReader(handle)
+            yield decompressed
+    finally:
+        response.close()
+        response.release_conn()
+        # Leituras do GzipFile incluem as leituras de rede; a diferenca e o custo do gunzip.
+        metrics.record("claim_check_fetch", open_elapsed + raw.elapsed)
+        if decompressed is not None:
+            metrics.record("gunzip", max(0.0, decompressed.elapsed - raw.elapsed))
+
+
+class _TimedReader:
+    """Envolve um stream binario acumulando o tempo gasto em `read` (para as metricas)."""
+
+    def __init__(self, stream: Any) -> None:
+        self.stream = stream
+        self.elapsed = 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        started = time.perf_counter()
+        try:
+            return self.stream.read(size)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+
+def _iter_json_items(stream: IO[bytes]) -> Iterator[Any]:
+    """Percorre `items` do payload descompactado sem materializar o documento inteiro."""
+    return ijson.items(stream, "items.item", use_float=True)
 
 
 def _get_minio_client() -> Optional[Minio]:
@@ -333,40 +1506,44 @@ def _get_minio_client() -> Optional[Minio]:
     return _minio_client
 
 
-def _gunzip_json_bytes(data: bytes, logger: logging.Logger) -> Dict[str, Any]:
-    try:
-        raw = gzip.decompress(data)
-        return json.loads(raw.decode("utf-8"))
-    except Exception as exc:
-        logger.warning("Falha ao descompactar payload.", extra={"error": str(exc)})
-        return {}
-
-
-def _read_gzip_json(path: str, logger: logging.Logger) -> Dict[str, Any]:
-    try:
-        with gzip.open(path, "rb") as handle:
-            raw = handle.read()
-        return json.loads(raw.decode("utf-8"))
-    except Exception as exc:
-        logger.warning("Falha ao ler payload local.", extra={"error": str(exc), "path": path})
-        return {}
-
-
 def _delete_claim_check_object(claim: Dict[str, Any], logger: logging.Logger) -> None:
+    """Pede a remocao do claim-check; a exclusao efetiva acontece em lote apos o commit."""
     storage_type = (claim.get("storage_type") or _get_env("STORAGE_TYPE", "minio")).lower()
     key = claim.get("claim_check")
+    if not key:
+        return
     if storage_type == "local":
-        if key:
-            try:
-                os.remove(os.path.join(_get_env("STORAGE_LOCAL_PATH", ""), key))
-            except Exception as exc:
-                logger.warning("Falha ao remover claim-check local.", extra={"error": str(exc)})
+        storage_gc.request(("file", "", os.path.join(_get_env("STORAGE_LOCAL_PATH", ""), key)))
         return
+    storage_gc.request(("minio", claim.get("bucket") or _get_env("MINIO_BUCKET", "telemetry-raw"), key))
 
-    client = _get_minio_client()
-    bucket = claim.get("bucket") or _get_env("MINIO_BUCKET", "telemetry-raw")
-    if client and key:
+
+def _remove_storage_objects(targets: List[DeleteTarget]) -> None:
+    """Executa um lote de remocoes: `remove_objects` por bucket no MinIO, os.remove no local."""
+    logger = logging.getLogger("telemetry-worker")
+    by_bucket: Dict[str, List[DeleteObject]] = {}
+    for kind, bucket, key in targets:
+        if kind == "minio":
+            by_bucket.setdefault(bucket, []).append(DeleteObject(key))
+            continue
         try:
-            client.remove_object(bucket, key)
+            os.remove(key)
+        except FileNotFoundError:
+            continue
+        except Exception as exc:
+            logger.warning("Falha ao remover arquivo.", extra={"error": str(exc), "path": key})
+
+    client = _get_minio_client() if by_bucket else None
+    if by_bucket and client is None:
+        logger.warning("MinIO nao configurado; objetos nao removidos.", extra={"count": len(targets)})
+        return
+    for bucket, objects in by_bucket.items():
+        try:
+            # remove_objects e preguicoso: as requisicoes so saem ao iterar os erros.
+            for error in client.remove_objects(bucket, objects):
+                logger.warning(
+                    "Falha ao remover objeto MinIO.",
+                    extra={"error": error.message, "bucket": bucket, "object": error.name}
+                )
         except Exception as exc:
-            logger.warning("Falha ao remover objeto MinIO.", extra={"error": str(exc)})
+            logger.warning("Falha ao remover objetos MinIO.", extra={"error": str(exc), "bucket": bucket})
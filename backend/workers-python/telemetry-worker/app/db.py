@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence, Set
+
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, connection as _connection
+from psycopg2.pool import ThreadedConnectionPool
+
+_pools: "OrderedDict[str, DatabasePool]" = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+class DatabaseUnavailable(RuntimeError):
+    pass
+
+
+class PooledConnection(_connection):
+    """Conexao com estado do pool: ultimo uso (ou a abertura) e statements ja preparados nesta sessao."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self.prepared: Set[str] = set()
+
+
+class DatabasePool:
+    """Pool thread-safe com reconexao preguicosa, validacao no checkout e metricas de saturacao.
+
+    O pool so e criado no primeiro uso; se o Postgres estiver fora, novas tentativas
+    respeitam um backoff exponencial em vez de falhar para sempre. Conexoes ociosas ha
+    mais de `validate_after` segundos passam por um `SELECT 1` antes de serem entregues,
+    e conexoes quebradas sao descartadas na devolucao (failover sem restart do pod).
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = 1,
+        maxconn: int = 10,
+        acquire_timeout: float = 10.0,
+        validate_after: float = 30.0,
+        max_backoff: float = 30.0
+    ) -> None:
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.acquire_timeout = acquire_timeout
+        self.validate_after = validate_after
+        self.max_backoff = max_backoff
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._failures = 0
+        self._retry_at = 0.0
+        self._in_use = 0
+        self._waiting = 0
+        self._retired = False
+        self._stats = {"acquired": 0, "wait_seconds": 0.0, "timeouts": 0, "discarded": 0, "connect_failures": 0}
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Empresta uma conexao validada; commit/rollback continuam com o chamador.
+
+        Se o pool foi retirado do registro depois que o chamador o obteve, a conexao vem
+        do pool atual do mesmo DSN.
+        """
+        started = time.monotonic()
+        with self._lock:
+            retired = self._retired
+            if not retired:
+                self._waiting += 1
+        if retired:
+            with get_pool(self.dsn, self.minconn, self.maxconn - self.minconn).connection() as conn:
+                yield conn
+            return
+        acquired = self._slots.acquire(timeout=self.acquire_timeout)
+        with self._lock:
+            self._waiting -= 1
+            self._stats["wait_seconds"] += time.monotonic() - started
+            if acquired:
+                # Em uso desde o slot: o pool nunca parece ocioso durante o checkout.
+                self._in_use += 1
+            else:
+                self._stats["timeouts"] += 1
+        if not acquired:
+            raise DatabaseUnavailable("Pool de banco saturado.")
+        conn = None
+        try:
+            conn = self._checkout()
+            with self._lock:
+                self._stats["acquired"] += 1
+            yield conn
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_connections": self.maxconn,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "utilization": self._in_use / self.maxconn,
+                **self._stats
+            }
+
+    def retire_if_idle(self) -> bool:
+        """Fecha o pool se ninguem o estiver usando; usos posteriores vao ao registro."""
+        with self._lock:
+            if self._in_use or self._waiting:
+                return False
+            self._retired = True
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.closeall()
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+            self._pool = None
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._retry_at:
+                raise DatabaseUnavailable("Banco indisponivel; aguardando nova tentativa de conexao.")
+            if self._pool is not None:
+                return self._pool
+            try:
+                self._pool = ThreadedConnectionPool(
+                    self.minconn,
+                    self.maxconn,
+                    dsn=self.dsn,
+                    connection_factory=PooledConnection
+                )
+            except Exception as exc:
+                raise self._connect_failed(now, exc) from exc
+            self._failures = 0
+            return self._pool
+
+    def _checkout(self) -> Any:
+        """Entrega a primeira conexao que responde; as quebradas sao descartadas.
+
+        Depois de um failover o pool pode ter varias conexoes ociosas mortas: cada uma
+        e descartada ate sobrar uma valida ou acabarem as ociosas, quando o pool abre
+        uma conexao nova (recem-aberta, dispensa o ping). Falha ao reconectar entra no
+        mesmo backoff da criacao do pool.
+        """
+        pool = self._get_pool()
+        while True:
+            try:
+                conn = pool.getconn()
+            except Exception as exc:
+                with self._lock:
+                    error = self._connect_failed(time.monotonic(), exc)
+                raise error from exc
+            if not conn.closed and (self._is_fresh(conn) or _ping(conn)):
+                with self._lock:
+                    self._failures = 0
+                return conn
+            self._discard(pool, conn)
+
+    def _connect_failed(self, now: float, exc: Exception) -> DatabaseUnavailable:
+        """Registra a falha de conexao e agenda a proxima tentativa (chamar com o lock)."""
+        self._failures += 1
+        self._stats["connect_failures"] += 1
+        self._retry_at = now + min(self.max_backoff, 2 ** (self._failures - 1))
+        return DatabaseUnavailable(f"Falha ao conectar no banco: {exc}")
+
+    def _checkin(self, conn: Any) -> None:
+        pool = self._pool
+        if pool is None:
+            conn.close()
+            return
+        if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            self._discard(pool, conn)
+            return
+        conn.last_used = time.monotonic()
+        pool.putconn(conn)
+
+    def _discard(self, pool: ThreadedConnectionPool, conn: Any) -> None:
+        with self._lock:
+            self._stats["discarded"] += 1
+        pool.putconn(conn, close=True)
+
+    def _is_fresh(self, conn: Any) -> bool:
+        return time.monotonic() - conn.last_used < self.validate_after
+
+
+def execute_prepared(cursor: Any, name: str, sql: str, params: Sequence[Any]) -> None:
+    """Executa um statement preparado no servidor, preparando-o uma vez por conexao.
+
+    `sql` usa placeholders posicionais do Postgres ($1, $2, ...). Exige uma conexao
+    emprestada de um DatabasePool.
+    """
+    conn = cursor.connection
+    if name not in conn.prepared:
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", tuple(params))
+
+
+def _ping(conn: Any) -> bool:
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def database_url() -> str:
+    database_url = _get_env("DATABASE_URL")
+    if database_url:
+        return database_url
+    host = _get_env("POSTGRES_HOST", "localhost")
+    port = _get_env("POSTGRES_PORT", "5432")
+    user = _get_env("POSTGRES_USER", "postgres")
+    password = _get_env("POSTGRES_PASSWORD", "")
+    db = _get_env("POSTGRES_DB", "control_plane")
+    return f"postgresql://{user}:{password}@{host}:{port}/{db}"
+
+
+def get_pool(dsn: str, pool_size: Optional[int] = None, max_overflow: Optional[int] = None) -> DatabasePool:
+    """Um pool por DSN no processo, configurado pelas variaveis DATABASE_POOL_*.
+
+    O registro guarda no maximo DATABASE_MAX_POOLS pools; ao passar do limite, o pool
+    ocioso usado ha mais tempo e fechado (volta a ser criado no proximo uso).
+    """
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is not None:
+            _pools.move_to_end(dsn)
+            return pool
+        if pool_size is None:
+            pool_size = int(_get_env("DATABASE_POOL_SIZE", "5") or 5)
+        if max_overflow is None:
+            max_overflow = int(_get_env("DATABASE_MAX_OVERFLOW", "5") or 5)
+        # Como no psycopg2 o pool fecha na devolucao o que excede minconn, o tamanho
+        # base fica aberto e o overflow e efemero.
+        pool = DatabasePool(
+            dsn,
+            minconn=pool_size,
+            maxconn=max(pool_size, pool_size + max_overflow),
+            acquire_timeout=float(_get_env("DATABASE_POOL_TIMEOUT_SECONDS", "10") or 10),
+            validate_after=float(_get_env("DATABASE_VALIDATE_IDLE_SECONDS", "30") or 30),
+            max_backoff=float(_get_env("DATABASE_RECONNECT_MAX_BACKOFF_SECONDS", "30") or 30)
+        )
+        _pools[dsn] = pool
+        _evict_idle_pools(int(_get_env("DATABASE_MAX_POOLS", "16") or 16))
+    return pool
+
+
+def _evict_idle_pools(max_pools: int) -> None:
+    for candidate in list(_pools):
+        if len(_pools) <= max(1, max_pools):
+            return
+        # A checagem de ociosidade e o fechamento sao atomicos no pool: quem o obteve
+        # antes da remocao e redirecionado ao pool novo do mesmo DSN.
+        if candidate == next(reversed(_pools)) or not _pools[candidate].retire_if_idle():
+            continue
+        del _pools[candidate]
+
+
+def all_pools() -> Dict[str, DatabasePool]:
+    with _pools_lock:
+        return dict(_pools)
@@ -0,0 +1,97 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+# Etapas que dependem de servicos externos (Postgres, MinIO) e sinalizam lentidao.
+PRESSURE_STAGES = ("persist", "claim_check_fetch")
+
+
+class AdaptiveBatchController:
+    """Ajusta o tamanho do poll e dos chunks de insert pela latencia medida e decide pausas.
+
+    Cada lote processado alimenta `observe`. Lotes rapidos crescem o poll em 25% ate
+    `max_batch`; lotes acima de `target_batch_seconds`, latencia de Postgres/MinIO acima
+    de `pressure_latency`, metade ou mais do lote falhando ou memoria acima de 90% do
+    limite cortam poll e chunk pela metade. O poll tambem fica limitado para que o lote
+    esperado caiba em metade de `max_poll_interval` (o worker nao e expulso do grupo).
+
+    Com pressao (latencia, falhas ou memoria acima do limite) as particoes sao pausadas
+    por um periodo que dobra a cada recaida ate `max_pause_seconds`; ao fim da pausa o
+    consumo volta com o lote reduzido, que serve de sonda.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        min_batch: int,
+        max_batch: int,
+        chunk_size: int,
+        min_chunk: int,
+        target_batch_seconds: float = 5.0,
+        max_poll_interval: float = 300.0,
+        pressure_latency: float = 2.0,
+        memory_limit: int = 0,
+        max_pause_seconds: float = 30.0,
+        enabled: bool = True
+    ) -> None:
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.batch_size = min(max(batch_size, self.min_batch), self.max_batch)
+        self.min_chunk = max(1, min(min_chunk, chunk_size))
+        self.max_chunk = max(1, chunk_size)
+        self.chunk_size = self.max_chunk
+        self.target_batch_seconds = target_batch_seconds
+        self.max_poll_interval = max_poll_interval
+        self.pressure_latency = pressure_latency
+        self.memory_limit = memory_limit
+        self.max_pause_seconds = max_pause_seconds
+        self.enabled = enabled
+        self._per_message: Optional[float] = None
+        self._pause_seconds = 0.0
+        self._paused_until = 0.0
+
+    def observe(self, messages: int, elapsed: float, failures: int, stage_timings: Dict[str, List[float]]) -> None:
+        if not self.enabled or messages <= 0:
+            return
+        per_message = elapsed / messages
+        self._per_message = per_message if self._per_message is None else 0.7 * self._per_message + 0.3 * per_message
+
+        latencies = [value for stage in PRESSURE_STAGES for value in stage_timings.get(stage, [])]
+        slow_dependencies = bool(latencies) and sum(latencies) / len(latencies) > self.pressure_latency
+        failing = failures * 2 >= messages
+        memory = self.memory_ratio()
+        pressured = slow_dependencies or failing or memory >= 1.0
+
+        if pressured or memory >= 0.9 or elapsed > self.target_batch_seconds:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+            self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+        elif elapsed < self.target_batch_seconds / 2:
+            self.batch_size = min(self.max_batch, self.batch_size + max(1, self.batch_size // 4))
+            self.chunk_size = min(self.max_chunk, self.chunk_size + max(1, self.chunk_size // 4))
+        if self._per_message > 0:
+            ceiling = int(self.max_poll_interval * 0.5 / self._per_message)
+            self.batch_size = max(self.min_batch, min(self.batch_size, ceiling))
+
+        if pressured:
+            self._pause_seconds = min(self.max_pause_seconds, max(1.0, self._pause_seconds * 2))
+            self._paused_until = time.monotonic() + self._pause_seconds
+        else:
+            self._pause_seconds = 0.0
+
+    def should_pause(self) -> bool:
+        return self.enabled and time.monotonic() < self._paused_until
+
+    def memory_ratio(self) -> float:
+        if self.memory_limit <= 0:
+            return 0.0
+        rss = _resident_memory()
+        return rss / self.memory_limit if rss is not None else 0.0
+
+
+def _resident_memory() -> Optional[int]:
+    """RSS atual do processo (Linux); None onde /proc nao existe."""
+    try:
+        with open("/proc/self/statm", "rb") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,31 @@
+import os
+from typing import Any, Dict, Optional
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+def client_options(default_client_id: str) -> Dict[str, Any]:
+    """Opcoes de conexao comuns a consumer e producer (brokers, client id, SSL/SASL)."""
+    brokers = _get_env("KAFKA_BROKERS", "kafka:9092")
+    ssl_enabled = _get_env("KAFKA_SSL", "false") == "true"
+    sasl_mechanism = _get_env("KAFKA_SASL_MECHANISM")
+
+    security_protocol = "PLAINTEXT"
+    if ssl_enabled and sasl_mechanism:
+        security_protocol = "SASL_SSL"
+    elif sasl_mechanism:
+        security_protocol = "SASL_PLAINTEXT"
+    elif ssl_enabled:
+        security_protocol = "SSL"
+
+    return {
+        "bootstrap_servers": brokers.split(","),
+        "client_id": _get_env("KAFKA_CLIENT_ID", default_client_id),
+        "security_protocol": security_protocol,
+        "sasl_mechanism": sasl_mechanism,
+        "sasl_plain_username": _get_env("KAFKA_SASL_USERNAME"),
+        "sasl_plain_password": _get_env("KAFKA_SASL_PASSWORD")
+    }
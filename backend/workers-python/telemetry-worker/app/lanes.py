@@ -0,0 +1,54 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, List, Tuple
+
+
+class HeavyLane:
+    """Lane de execucao para mensagens pesadas (claim-check), com concorrencia propria.
+
+    O loop principal entrega a mensagem e segue com os eventos pequenos; ate
+    `concurrency` mensagens rodam em paralelo e no maximo `capacity` ficam em andamento.
+    Com a lane cheia `submit` bloqueia, o que segura o consumo em vez de acumular
+    payloads em memoria. Resultados (ou a excecao) ficam disponiveis em `completed`.
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], concurrency: int, capacity: int) -> None:
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="heavy-lane")
+        self._slots = threading.BoundedSemaphore(max(self.concurrency, capacity))
+        self._done: Deque[Tuple[Any, Any]] = deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> None:
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+        future = self._executor.submit(self.handler, item)
+        future.add_done_callback(lambda done, item=item: self._finish(item, done))
+
+    def completed(self) -> List[Tuple[Any, Any]]:
+        results: List[Tuple[Any, Any]] = []
+        while self._done:
+            results.append(self._done.popleft())
+        return results
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+    def close(self) -> None:
+        """Aguarda as mensagens em andamento; os resultados continuam em `completed`."""
+        self._executor.shutdown(wait=True)
+
+    def _finish(self, item: Any, future: Future) -> None:
+        try:
+            result = future.result()
+        except Exception as exc:
+            result = exc
+        self._done.append((item, result))
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
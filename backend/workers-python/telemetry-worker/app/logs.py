@@ -0,0 +1,167 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from pythonjsonlogger import jsonlogger
+
+from app import codec
+
+_listeners: Dict[str, QueueListener] = {}
+# Chaves por objeto no LOG_PAYLOAD=full.
+_LOG_MAX_KEYS = 50
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Enfileira o registro sem formatar; com a fila cheia o log e descartado, nunca bloqueia.
+
+    A formatacao (inclusive a serializacao JSON dos `extra`) acontece na thread do
+    QueueListener, fora do caminho de consumo. Descartes sao contados (`dropped`,
+    exportado em /metrics) e, quando a fila volta a ter espaco, um aviso com o total
+    perdido e registrado antes do proximo log.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]", name: str) -> None:
+        super().__init__(log_queue)
+        self.logger_name = name
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Chamado sob o lock do handler (Handler.handle): contadores sem lock proprio.
+        try:
+            if self._unreported:
+                self.queue.put_nowait(self._dropped_warning())
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+    def _dropped_warning(self) -> logging.LogRecord:
+        record = logging.LogRecord(
+            self.logger_name,
+            logging.WARNING,
+            __file__,
+            0,
+            "Registros de log descartados com a fila cheia.",
+            None,
+            None
+        )
+        record.dropped = self._unreported
+        return record
+
+
+def dropped_records() -> int:
+    """Total de registros de log descartados pelos handlers assincronos do processo."""
+    return sum(
+        handler.dropped
+        for name in _listeners
+        for handler in logging.getLogger(name).handlers
+        if isinstance(handler, _NonBlockingQueueHandler)
+    )
+
+
+def setup_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    level = os.getenv("LOG_LEVEL", "info").upper()
+    if (os.getenv("DEBUG", "false") or "false").lower() == "true" and level == "INFO":
+        level = "DEBUG"
+    logger.setLevel(level)
+    if name in _listeners:
+        return logger
+
+    handler = logging.StreamHandler()
+    log_format = os.getenv("LOG_FORMAT", "json").lower()
+    if log_format == "text":
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    else:
+        formatter = jsonlogger.JsonFormatter(
+            "%(asctime)s %(levelname)s %(name)s %(message)s %(correlation_id)s"
+        )
+    handler.setFormatter(formatter)
+
+    if (_get_env("LOG_ASYNC", "true") or "true").lower() != "true":
+        logger.handlers = [handler]
+        return logger
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(int(_get_env("LOG_QUEUE_SIZE", "10000") or 10000))
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    _listeners[name] = listener
+    logger.handlers = [_NonBlockingQueueHandler(log_queue, name)]
+    return logger
+
+
+def should_log_event(logger: logging.Logger) -> bool:
+    """Amostragem dos logs por mensagem (LOG_SAMPLE_RATE entre 0 e 1)."""
+    if not logger.isEnabledFor(logging.INFO):
+        return False
+    rate = float(_get_env("LOG_SAMPLE_RATE", "1") or 1)
+    return rate >= 1 or random.random() < rate
+
+
+def payload_for_log(payload: Dict[str, Any]) -> Any:
+    """Representacao barata do payload para log, conforme LOG_PAYLOAD.
+
+    summary (padrao): campos do envelope e contagem de itens; full: JSON truncado em
+    LOG_PAYLOAD_MAX_CHARS, serializado a partir de uma copia podada (listas com no maximo
+    LOG_PAYLOAD_MAX_ITEMS elementos, textos e profundidade limitados) para que o custo
+    nao cresca com o tamanho de `items`; none: nada.
+    """
+    mode = (_get_env("LOG_PAYLOAD", "summary") or "summary").lower()
+    if mode == "none":
+        return None
+    if mode == "full":
+        max_chars = int(_get_env("LOG_PAYLOAD_MAX_CHARS", "2048") or 2048)
+        max_items = int(_get_env("LOG_PAYLOAD_MAX_ITEMS", "10") or 10)
+        text = codec.dumps(_pruned(payload, max_items, max_chars, 6)).decode("utf-8")
+        return text if len(text) <= max_chars else f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+
+    summary: Dict[str, Any] = {
+        key: payload.get(key)
+        for key in ("event_id", "event_type", "tenant_id", "created_at")
+        if payload.get(key) is not None
+    }
+    items = payload.get("items")
+    if isinstance(items, list):
+        summary["items"] = len(items)
+    if payload.get("claim_check"):
+        summary["claim_check"] = payload.get("claim_check")
+    summary["keys"] = sorted(payload.keys())[:20]
+    return summary
+
+
+def _pruned(value: Any, max_items: int, max_chars: int, depth: int) -> Any:
+    """Copia do valor com listas, dicts, textos e aninhamento limitados (para log)."""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars]
+    if depth <= 0 and isinstance(value, (dict, list)):
+        return "..."
+    if isinstance(value, dict):
+        pruned = {
+            str(key): _pruned(item, max_items, max_chars, depth - 1)
+            for key, item in islice(value.items(), _LOG_MAX_KEYS)
+        }
+        if len(value) > _LOG_MAX_KEYS:
+            pruned["..."] = f"+{len(value) - _LOG_MAX_KEYS} chaves"
+        return pruned
+    if isinstance(value, list):
+        pruned_items = [_pruned(item, max_items, max_chars, depth - 1) for item in value[:max_items]]
+        if len(value) > max_items:
+            pruned_items.append(f"...(+{len(value) - max_items} itens)")
+        return pruned_items
+    return value
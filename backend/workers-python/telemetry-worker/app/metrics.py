@@ -0,0 +1,180 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+from urllib.parse import urlsplit
+
+from app import logs
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+    from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # pragma: no cover - depende do ambiente
+    start_http_server = None
+
+STAGES = ("deserialize", "claim_check_fetch", "gunzip", "persist", "usage_emit")
+_MAX_BUFFERED = 10000
+
+# Buffer local do processo: workers do pool nao exportam metricas; devolvem o snapshot
+# de `drain()` junto com o resultado e o processo principal aplica com `merge()`.
+_lock = threading.Lock()
+_timings: Dict[str, List[float]] = {}
+_counts: Dict[str, int] = {}
+
+if start_http_server is not None:
+    _MESSAGES = Counter("worker_messages_total", "Mensagens Kafka consumidas.")
+    _EVENTS = Counter("worker_events_total", "Eventos por desfecho (retry, dead-letter, duplicado).", ["outcome"])
+    _STAGE_SECONDS = Histogram(
+        "worker_stage_duration_seconds",
+        "Latencia por etapa do processamento.",
+        ["stage"],
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    )
+    _LAG = Gauge("worker_consumer_lag", "Mensagens entre o high watermark e a posicao do consumer.", ["topic", "partition"])
+    _RETRY_QUEUE = Gauge("worker_retry_queue_size", "Eventos estacionados aguardando retry.")
+    _TENANT_BACKLOG = Gauge("worker_tenant_backlog", "Mensagens adiadas pela quota do tenant.", ["tenant"])
+    _TENANT_LAG = Gauge(
+        "worker_tenant_lag_seconds",
+        "Idade da mensagem mais antiga do tenant no ultimo lote processado.",
+        ["tenant"]
+    )
+
+
+def record(stage: str, seconds: float) -> None:
+    with _lock:
+        values = _timings.setdefault(stage, [])
+        if len(values) < _MAX_BUFFERED:
+            values.append(seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def count(name: str, value: int = 1) -> None:
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + value
+
+
+def drain() -> Dict[str, Any]:
+    global _timings, _counts
+    with _lock:
+        snapshot = {"timings": _timings, "counts": _counts}
+        _timings, _counts = {}, {}
+    return snapshot
+
+
+def merge(snapshot: Optional[Dict[str, Any]]) -> None:
+    if start_http_server is None or not snapshot:
+        return
+    for stage, values in snapshot.get("timings", {}).items():
+        histogram = _STAGE_SECONDS.labels(stage)
+        for value in values:
+            histogram.observe(value)
+    for name, value in snapshot.get("counts", {}).items():
+        if name == "messages":
+            _MESSAGES.inc(value)
+        else:
+            _EVENTS.labels(name).inc(value)
+
+
+def set_lag(lags: Dict[Any, int]) -> None:
+    """Substitui o lag por particao (chaves TopicPartition) pelas particoes atuais."""
+    if start_http_server is None:
+        return
+    _LAG.clear()
+    for tp, lag in lags.items():
+        _LAG.labels(tp.topic, str(tp.partition)).set(lag)
+
+
+def set_tenant_backlog(backlog: Dict[str, int]) -> None:
+    """Substitui o backlog por tenant; tenants sem mensagens adiadas saem da serie."""
+    if start_http_server is None:
+        return
+    _TENANT_BACKLOG.clear()
+    for tenant, size in backlog.items():
+        _TENANT_BACKLOG.labels(tenant).set(size)
+
+
+def set_tenant_lag(lags: Dict[str, float]) -> None:
+    """Substitui o atraso por tenant; tenants fora do ultimo lote saem da serie."""
+    if start_http_server is None:
+        return
+    _TENANT_LAG.clear()
+    for tenant, seconds in lags.items():
+        _TENANT_LAG.labels(tenant).set(seconds)
+
+
+class _PoolCollector:
+    def __init__(self, pool_stats: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+        self.pool_stats = pool_stats
+
+    def collect(self) -> Iterator[Any]:
+        connections = GaugeMetricFamily(
+            "worker_db_pool_connections", "Conexoes do pool por estado.", labels=["pool", "state"]
+        )
+        utilization = GaugeMetricFamily("worker_db_pool_utilization", "Fracao do pool em uso.", labels=["pool"])
+        timeouts = CounterMetricFamily(
+            "worker_db_pool_timeouts", "Checkouts que esgotaram o tempo de espera.", labels=["pool"]
+        )
+        wait_seconds = CounterMetricFamily(
+            "worker_db_pool_wait_seconds", "Tempo total aguardando conexao.", labels=["pool"]
+        )
+        names: Set[str] = set()
+        for dsn, stats in self.pool_stats().items():
+            name = _pool_name(dsn)
+            if name in names:
+                # Mesmo host/banco com outro usuario: labels repetidos derrubariam o scrape.
+                name = f"{name}~{hashlib.sha256(dsn.encode('utf-8')).hexdigest()[:8]}"
+            names.add(name)
+            connections.add_metric([name, "in_use"], stats["in_use"])
+            connections.add_metric([name, "waiting"], stats["waiting"])
+            connections.add_metric([name, "max"], stats["max_connections"])
+            utilization.add_metric([name], stats["utilization"])
+            timeouts.add_metric([name], stats["timeouts"])
+            wait_seconds.add_metric([name], stats["wait_seconds"])
+        yield connections
+        yield utilization
+        yield timeouts
+        yield wait_seconds
+
+
+class _LogDropCollector:
+    def collect(self) -> Iterator[Any]:
+        dropped = CounterMetricFamily(
+            "worker_log_records_dropped", "Registros de log descartados com a fila de log cheia."
+        )
+        dropped.add_metric([], logs.dropped_records())
+        yield dropped
+
+
+def _pool_name(dsn: str) -> str:
+    """`host:porta/banco` do DSN (URL ou `chave=valor`), sem usuario nem senha."""
+    if "://" in dsn:
+        parts = urlsplit(dsn)
+        host, port, database = parts.hostname, parts.port, parts.path.lstrip("/")
+    else:
+        params = dict(item.split("=", 1) for item in dsn.split() if "=" in item)
+        host, port, database = params.get("host"), params.get("port"), params.get("dbname")
+    return f"{host or 'localhost'}:{port or 5432}/{database or 'default'}"
+
+
+def start_server(
+    port: int,
+    pool_stats: Callable[[], Dict[str, Dict[str, Any]]],
+    retry_queue_size: Callable[[], int]
+) -> bool:
+    """Sobe o endpoint /metrics em uma thread daemon; False se prometheus_client faltar."""
+    if start_http_server is None:
+        return False
+    REGISTRY.register(_PoolCollector(pool_stats))
+    REGISTRY.register(_LogDropCollector())
+    _RETRY_QUEUE.set_function(retry_queue_size)
+    start_http_server(port)
+    return True
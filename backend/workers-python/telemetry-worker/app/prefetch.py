@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+class ClaimCheckPrefetcher:
+    """Baixa objetos de claim-check em paralelo enquanto mensagens anteriores sao persistidas.
+
+    Cada download reserva `size` bytes (o `file_size` compactado do claim) de um orcamento
+    de memoria; objetos sem tamanho conhecido ou que nao cabem no orcamento nao sao
+    pre-carregados e o consumer volta ao streaming sob demanda. O conteudo fica em memoria
+    compactado ate `take`, que libera a reserva.
+    """
+
+    def __init__(self, fetch: Callable[[Hashable], bytes], max_workers: int, memory_budget: int) -> None:
+        self.fetch = fetch
+        self.memory_budget = max(0, memory_budget)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="claim-prefetch")
+        self._pending: Dict[Hashable, Tuple[Future, int]] = {}
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def prefetch(self, key: Hashable, size: int) -> bool:
+        if size <= 0:
+            return False
+        with self._lock:
+            if key in self._pending:
+                return True
+            if self._reserved + size > self.memory_budget:
+                return False
+            self._reserved += size
+            self._pending[key] = (self._executor.submit(self.fetch, key), size)
+        return True
+
+    def take(self, key: Hashable) -> Optional[bytes]:
+        """Conteudo pre-carregado (aguarda o download em andamento); None se nao houver ou falhar."""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        future, size = entry
+        try:
+            return future.result()
+        except Exception:
+            return None
+        finally:
+            with self._lock:
+                self._reserved -= size
+
+    def discard(self, keys: Iterable[Hashable]) -> None:
+        """Descarta downloads nao consumidos (ex.: evento duplicado ou falha antes da leitura)."""
+        for key in keys:
+            with self._lock:
+                entry = self._pending.pop(key, None)
+            if entry is None:
+                continue
+            future, size = entry
+            if not future.cancel():
+                future.add_done_callback(lambda _future, size=size: self._release(size))
+                continue
+            self._release(size)
+
+    def reserved(self) -> int:
+        with self._lock:
+            return self._reserved
+
+    def _release(self, size: int) -> None:
+        with self._lock:
+            self._reserved -= size
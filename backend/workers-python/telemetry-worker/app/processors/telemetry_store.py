@@ -0,0 +1,88 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from app import codec
+from app.db import execute_prepared
+
+TELEMETRY_COLUMNS = ("time", "tenant_id", "event_id", "item_index", "payload")
+
+_COPY_SQL = (
+    f"COPY telemetry_events ({', '.join(TELEMETRY_COLUMNS)}) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+_CLAIM_SQL = (
+    "INSERT INTO telemetry_ingested_events (event_id, tenant_id) VALUES ($1, $2) "
+    "ON CONFLICT (event_id) DO NOTHING"
+)
+
+
+def build_item_rows(
+    items: Sequence[Any],
+    envelope: Dict[str, Any],
+    start_index: int = 0
+) -> List[Sequence[Any]]:
+    """Converte itens do payload em linhas na ordem de TELEMETRY_COLUMNS."""
+    tenant_id = envelope.get("tenant_id")
+    event_id = envelope.get("event_id")
+    fallback_time = _format_time(envelope.get("created_at")) or datetime.now(timezone.utc).isoformat()
+
+    rows: List[Sequence[Any]] = []
+    for offset, item in enumerate(items):
+        item_time = None
+        if isinstance(item, dict):
+            item_time = _format_time(item.get("timestamp") or item.get("time"))
+        rows.append(
+            (
+                item_time or fallback_time,
+                tenant_id,
+                event_id,
+                start_index + offset,
+                codec.dumps(item).decode("utf-8")
+            )
+        )
+    return rows
+
+
+def claim_event(conn: Any, envelope: Dict[str, Any]) -> bool:
+    """Registra o event_id na transacao corrente; False se o evento ja foi ingerido.
+
+    A chave unica em telemetry_ingested_events torna a ingestao idempotente: reentregas
+    e replays caem no ON CONFLICT e o COPY dos itens nao e executado.
+    """
+    event_id = envelope.get("event_id")
+    if not event_id:
+        return True
+    with conn.cursor() as cursor:
+        execute_prepared(cursor, "telemetry_claim_event", _CLAIM_SQL, (str(event_id), envelope.get("tenant_id")))
+        return cursor.rowcount == 1
+
+
+def copy_rows(conn: Any, rows: Iterable[Sequence[Any]]) -> int:
+    """Envia as linhas ao hypertable com um unico COPY a partir de um buffer em memoria."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    if count == 0:
+        return 0
+
+    buffer.seek(0)
+    with conn.cursor() as cursor:
+        cursor.copy_expert(_COPY_SQL, buffer)
+    return count
+
+
+def _format_time(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e12 else value
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+    if isinstance(value, str) and value:
+        return value
+    return None
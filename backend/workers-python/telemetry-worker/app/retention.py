@@ -0,0 +1,279 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app import codec
+
+# Pastas nomeadas pela data (ex.: `2026-10-18T12-30-45-123Z`, gerada pela API no
+# claim-check, ou `2026-10-18`) expiram inteiras sem stat dos arquivos.
+_DATED_DIR = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+_CURSOR_FILE = ".retention-cursor.json"
+_LIFECYCLE_RULE_ID = "worker-retention"
+
+
+class RetentionEngine:
+    """Limpeza de retencao em background, incremental e retomavel.
+
+    O storage local e percorrido com `os.scandir` em ordem lexica; cada fatia de
+    `slice_seconds` processa o que couber e devolve o controle, com pausa de
+    `pause_seconds` entre fatias. Diretorios com data no nome (`YYYY-MM-DD...` ou
+    `YYYY/MM/DD`) anteriores ao corte sao removidos de uma vez. A posicao da varredura
+    fica em um cursor persistido, para que um restart continue de onde parou.
+
+    No MinIO, `lifecycle` registra uma regra de expiracao no bucket (o proprio MinIO
+    apaga) e `list` lista o prefixo a partir do cursor e remove em lote com
+    `remove_objects`.
+    """
+
+    def __init__(
+        self,
+        retention_days: int,
+        base_path: Optional[str],
+        logger: logging.Logger,
+        interval: float = 3600.0,
+        slice_seconds: float = 0.2,
+        pause_seconds: float = 1.0,
+        cursor_path: Optional[str] = None,
+        minio_client: Any = None,
+        bucket: Optional[str] = None,
+        minio_mode: str = "off",
+        minio_prefix: str = ""
+    ) -> None:
+        self.retention_days = retention_days
+        self.base_path = base_path
+        self.logger = logger
+        self.interval = interval
+        self.slice_seconds = slice_seconds
+        self.pause_seconds = pause_seconds
+        self.cursor_path = cursor_path
+        self.minio_client = minio_client if minio_mode in ("lifecycle", "list") and bucket else None
+        self.bucket = bucket
+        self.minio_mode = minio_mode
+        self.minio_prefix = minio_prefix
+        self._cursor: Dict[str, Optional[str]] = self._load_cursor()
+        self._local_walk: Optional[Iterator[Tuple[str, ...]]] = None
+        self._minio_walk: Optional[Iterator[Any]] = None
+        self._minio_cutoff = datetime.now(timezone.utc)
+        self._minio_batch: List[str] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.minio_client is not None and self.minio_mode == "lifecycle":
+            self._apply_lifecycle()
+        if not self.base_path and not (self.minio_client is not None and self.minio_mode == "list"):
+            return
+        self._thread = threading.Thread(target=self._run, name="storage-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._flush_minio_batch()
+        self._save_cursor()
+
+    def _run(self) -> None:
+        delay = 0.0
+        while not self._stop.wait(delay):
+            try:
+                finished = self.run_slice()
+            except Exception as exc:
+                self.logger.warning("Falha na limpeza de retencao.", extra={"error": str(exc)})
+                self._local_walk = self._minio_walk = None
+                finished = True
+            delay = self.interval if finished else self.pause_seconds
+
+    def run_slice(self) -> bool:
+        """Processa ate `slice_seconds`; True quando a passada atual terminou."""
+        deadline = time.monotonic() + self.slice_seconds
+        local_done = self._local_slice(deadline)
+        minio_done = self._minio_slice(deadline) if local_done else False
+        self._save_cursor()
+        return local_done and minio_done
+
+    def _cutoff(self) -> float:
+        return time.time() - self.retention_days * 86400
+
+    # Storage local
+
+    def _local_slice(self, deadline: float) -> bool:
+        if not self.base_path or not os.path.isdir(self.base_path):
+            return True
+        if self._local_walk is None:
+            start = tuple(filter(None, (self._cursor.get("local") or "").split("/")))
+            self._local_walk = self._walk_local(self.base_path, (), start, self._cutoff())
+        for parts in self._local_walk:
+            self._cursor["local"] = "/".join(parts)
+            if time.monotonic() >= deadline:
+                return False
+        self._local_walk = None
+        self._cursor["local"] = None
+        return True
+
+    def _walk_local(
+        self,
+        path: str,
+        parts: Tuple[str, ...],
+        start: Tuple[str, ...],
+        cutoff: float
+    ) -> Iterator[Tuple[str, ...]]:
+        try:
+            with os.scandir(path) as entries:
+                names = sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries)
+        except FileNotFoundError:
+            return
+        for name, is_dir in names:
+            if not parts and name.startswith(_CURSOR_FILE):
+                continue
+            entry_parts = parts + (name,)
+            resuming = len(start) > len(entry_parts) and start[: len(entry_parts)] == entry_parts
+            if not resuming and entry_parts <= start:
+                continue
+            entry_path = os.path.join(path, name)
+            if is_dir:
+                if _expired_directory(entry_parts, cutoff):
+                    shutil.rmtree(entry_path, ignore_errors=True)
+                else:
+                    yield from self._walk_local(entry_path, entry_parts, start if resuming else (), cutoff)
+                    _remove_if_empty(entry_path)
+            else:
+                try:
+                    if os.stat(entry_path, follow_symlinks=False).st_mtime < cutoff:
+                        os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as exc:
+                    self.logger.warning("Falha ao limpar arquivo antigo.", extra={"error": str(exc), "path": entry_path})
+            yield entry_parts
+
+    # MinIO
+
+    def _apply_lifecycle(self) -> None:
+        from minio.commonconfig import ENABLED, Filter
+        from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
+
+        try:
+            current = self.minio_client.get_bucket_lifecycle(self.bucket)
+            existing = [rule for rule in (current.rules if current else []) if rule.rule_id == _LIFECYCLE_RULE_ID]
+            if existing and _rule_matches(existing[0], self.minio_prefix, self.retention_days):
+                # A configuracao do bucket e compartilhada: so reescreve quando a regra mudou.
+                return
+            rules = [rule for rule in (current.rules if current else []) if rule.rule_id != _LIFECYCLE_RULE_ID]
+            rules.append(
+                Rule(
+                    ENABLED,
+                    rule_filter=Filter(prefix=self.minio_prefix),
+                    rule_id=_LIFECYCLE_RULE_ID,
+                    expiration=Expiration(days=self.retention_days)
+                )
+            )
+            self.minio_client.set_bucket_lifecycle(self.bucket, LifecycleConfig(rules))
+            self.logger.info(
+                "Regra de expiracao aplicada no bucket.",
+                extra={"bucket": self.bucket, "prefix": self.minio_prefix, "days": self.retention_days}
+            )
+        except Exception as exc:
+            self.logger.warning("Falha ao aplicar lifecycle no bucket.", extra={"error": str(exc), "bucket": self.bucket})
+
+    def _minio_slice(self, deadline: float) -> bool:
+        if self.minio_client is None or self.minio_mode != "list":
+            return True
+        if self._minio_walk is None:
+            self._minio_walk = iter(
+                self.minio_client.list_objects(
+                    self.bucket,
+                    prefix=self.minio_prefix or None,
+                    recursive=True,
+                    start_after=self._cursor.get("minio") or None
+                )
+            )
+            self._minio_cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        for obj in self._minio_walk:
+            if obj.last_modified is not None and obj.last_modified < self._minio_cutoff:
+                self._minio_batch.append(obj.object_name)
+                if len(self._minio_batch) >= 1000:
+                    self._flush_minio_batch()
+            if time.monotonic() >= deadline:
+                self._flush_minio_batch()
+                self._cursor["minio"] = obj.object_name
+                return False
+        self._flush_minio_batch()
+        self._minio_walk = None
+        self._cursor["minio"] = None
+        return True
+
+    def _flush_minio_batch(self) -> None:
+        if not self._minio_batch or self.minio_client is None:
+            return
+        from minio.deleteobjects import DeleteObject
+
+        batch, self._minio_batch = self._minio_batch, []
+        for error in self.minio_client.remove_objects(self.bucket, [DeleteObject(name) for name in batch]):
+            self.logger.warning(
+                "Falha ao remover objeto expirado.",
+                extra={"error": error.message, "bucket": self.bucket, "object": error.name}
+            )
+
+    # Cursor
+
+    def _load_cursor(self) -> Dict[str, Optional[str]]:
+        if not self.cursor_path:
+            return {}
+        try:
+            with open(self.cursor_path, "rb") as handle:
+                cursor = codec.loads(handle.read())
+            return cursor if isinstance(cursor, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as exc:
+            self.logger.warning("Cursor de retencao invalido; varredura reiniciada.", extra={"error": str(exc)})
+            return {}
+
+    def _save_cursor(self) -> None:
+        if not self.cursor_path:
+            return
+        temp_path = f"{self.cursor_path}.tmp"
+        try:
+            with open(temp_path, "wb") as handle:
+                handle.write(codec.dumps(self._cursor))
+            os.replace(temp_path, self.cursor_path)
+        except Exception as exc:
+            self.logger.warning("Falha ao salvar cursor de retencao.", extra={"error": str(exc)})
+
+
+def _rule_matches(rule: Any, prefix: str, days: int) -> bool:
+    rule_prefix = getattr(rule.rule_filter, "prefix", None) if rule.rule_filter is not None else None
+    rule_days = getattr(rule.expiration, "days", None) if rule.expiration is not None else None
+    return (rule_prefix or "") == (prefix or "") and rule_days == days
+
+
+def _expired_directory(parts: Tuple[str, ...], cutoff: float) -> bool:
+    day = _directory_day(parts)
+    if day is None:
+        return False
+    return (day + timedelta(days=1)).timestamp() <= cutoff
+
+
+def _directory_day(parts: Tuple[str, ...]) -> Optional[datetime]:
+    try:
+        match = _DATED_DIR.match(parts[-1])
+        if match:
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)), tzinfo=timezone.utc)
+        if len(parts) >= 3 and all(part.isdigit() for part in parts[-3:]) and len(parts[-3]) == 4:
+            return datetime(int(parts[-3]), int(parts[-2]), int(parts[-1]), tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return None
+
+
+def _remove_if_empty(path: str) -> None:
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
@@ -0,0 +1,107 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Tuple
+
+# ("minio", bucket, objeto) ou ("file", "", caminho absoluto)
+DeleteTarget = Tuple[str, str, str]
+
+# Remocoes pedidas durante o processamento da mensagem atual (por thread, ja que
+# claim-checks podem rodar em uma lane propria). O chamador recolhe com
+# `take_requested` e associa ao offset da mensagem.
+_local = threading.local()
+
+
+def request(target: DeleteTarget) -> None:
+    if not hasattr(_local, "requested"):
+        _local.requested = []
+    _local.requested.append(target)
+
+
+def take_requested() -> List[DeleteTarget]:
+    targets = getattr(_local, "requested", [])
+    _local.requested = []
+    return targets
+
+
+class DeletionQueue:
+    """Remove arquivos de claim-check em lote, em background e so depois do commit do offset.
+
+    Enquanto o offset da mensagem nao foi commitado o objeto continua no storage, para que
+    uma reentrega ou replay ainda encontre o payload. Liberadas pelo commit, as remocoes
+    sao agrupadas (ate `batch_size` ou a cada `flush_interval` segundos) e executadas por
+    `remover` em uma thread propria, fora do loop de consumo. Um timer garante o flush
+    por intervalo mesmo com o worker ocioso (sem commits novos).
+    """
+
+    def __init__(
+        self,
+        remover: Callable[[List[DeleteTarget]], None],
+        batch_size: int = 500,
+        flush_interval: float = 5.0
+    ) -> None:
+        self.remover = remover
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._deferred: Dict[Hashable, List[Tuple[int, DeleteTarget]]] = {}
+        self._ready: List[DeleteTarget] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-gc")
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name="storage-gc-timer", daemon=True)
+        self._timer.start()
+
+    def defer(self, partition: Hashable, offset: int, targets: List[DeleteTarget]) -> None:
+        if not targets:
+            return
+        with self._lock:
+            self._deferred.setdefault(partition, []).extend((offset, target) for target in targets)
+
+    def release(self, committed: Dict[Hashable, int]) -> None:
+        """Libera as remocoes de offsets abaixo do offset commitado de cada particao."""
+        with self._lock:
+            for partition, next_offset in committed.items():
+                deferred = self._deferred.get(partition)
+                if not deferred:
+                    continue
+                self._ready.extend(target for offset, target in deferred if offset < next_offset)
+                self._deferred[partition] = [(offset, target) for offset, target in deferred if offset >= next_offset]
+        self.maybe_flush()
+
+    def forget(self, partitions: List[Hashable]) -> None:
+        """Particao revogada: quem assumir reprocessa as mensagens e pede as remocoes de novo."""
+        with self._lock:
+            for partition in partitions:
+                self._deferred.pop(partition, None)
+
+    def submit(self, targets: List[DeleteTarget]) -> None:
+        if not targets:
+            return
+        with self._lock:
+            self._ready.extend(targets)
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        with self._lock:
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if not self._ready or (len(self._ready) < self.batch_size and not due):
+                return
+            batch, self._ready = self._ready, []
+            self._last_flush = time.monotonic()
+        for start in range(0, len(batch), self.batch_size):
+            self._executor.submit(self.remover, batch[start : start + self.batch_size])
+
+    def _flush_periodically(self) -> None:
+        while not self._stop.wait(max(self.flush_interval, 0.5)):
+            self.maybe_flush()
+
+    def close(self) -> None:
+        """Executa o que ja foi liberado e aguarda; remocoes ainda nao commitadas ficam no storage."""
+        self._stop.set()
+        self._timer.join()
+        with self._lock:
+            batch, self._ready = self._ready, []
+        if batch:
+            self._executor.submit(self.remover, batch)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.db import DatabasePool, execute_prepared
+
+# Parametros tipados (sem cast nas colunas) para usar os indices de tenants.uuid e tenants.id.
+_TENANT_DB_BY_UUID_SQL = "SELECT telemetry_db FROM tenants WHERE uuid = $1::uuid"
+_TENANT_DB_BY_ID_SQL = "SELECT telemetry_db FROM tenants WHERE id = $1::integer"
+_MAX_TENANT_ID = 2 ** 31 - 1
+
+
+class TenantDatabaseNotConfigured(RuntimeError):
+    pass
+
+
+class TenantRouter:
+    """Resolve o banco de telemetria de cada tenant com cache por TTL.
+
+    `tenants.telemetry_db` guarda o nome logico do banco; a connection string vem de
+    `DB_CATALOG__<nome>`, como no DbCatalogService da API. Tenants sem `telemetry_db`
+    (ou desconhecidos) usam `default_dsn`. Se o control plane estiver indisponivel, a
+    ultima resolucao conhecida continua valendo ate a consulta voltar a funcionar.
+    """
+
+    def __init__(self, control_plane: Callable[[], DatabasePool], default_dsn: str, ttl: float = 60.0) -> None:
+        self.control_plane = control_plane
+        self.default_dsn = default_dsn
+        self.ttl = ttl
+        self._cache: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def dsn_for(self, tenant_id: Any) -> str:
+        if tenant_id is None or tenant_id == "":
+            return self.default_dsn
+        key = str(tenant_id)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        try:
+            dsn = self._resolve(key)
+        except TenantDatabaseNotConfigured:
+            raise
+        except Exception:
+            if cached is None:
+                raise
+            return cached[0]
+        with self._lock:
+            self._cache[key] = (dsn, now + self.ttl)
+        return dsn
+
+    def invalidate(self, tenant_id: Any = None) -> None:
+        with self._lock:
+            if tenant_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(str(tenant_id), None)
+
+    def _resolve(self, tenant_id: str) -> str:
+        lookup = _tenant_lookup(tenant_id)
+        if lookup is None:
+            # Nem uuid nem id numerico: tenant desconhecido, usa o banco padrao.
+            return self.default_dsn
+        name, sql, param = lookup
+        with self.control_plane().connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    execute_prepared(cursor, name, sql, (param,))
+                    row = cursor.fetchone()
+            finally:
+                conn.rollback()
+        logical_name = row[0] if row else None
+        if not logical_name:
+            return self.default_dsn
+        dsn = resolve_catalog(logical_name)
+        if not dsn:
+            raise TenantDatabaseNotConfigured(
+                f"Connection string nao encontrada no catalogo para {logical_name} (tenant {tenant_id})."
+            )
+        return dsn
+
+
+def _tenant_lookup(tenant_id: str) -> Optional[Tuple[str, str, Any]]:
+    if tenant_id.isascii() and tenant_id.isdigit():
+        value = int(tenant_id)
+        return ("telemetry_tenant_db_by_id", _TENANT_DB_BY_ID_SQL, value) if value <= _MAX_TENANT_ID else None
+    try:
+        return "telemetry_tenant_db_by_uuid", _TENANT_DB_BY_UUID_SQL, str(uuid.UUID(tenant_id))
+    except ValueError:
+        return None
+
+
+def resolve_catalog(logical_name: str) -> Optional[str]:
+    value = os.getenv(f"DB_CATALOG__{logical_name}")
+    return value if value else None
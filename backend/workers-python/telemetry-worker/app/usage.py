@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+UsageKey = Tuple[str, str, str, str]
+
+
+class UsageAggregator:
+    """Soma metricas de uso em memoria por (tenant_id, metric_key, period, source).
+
+    O flush acontece quando o numero de chaves atinge `max_keys` ou quando
+    `flush_interval` segundos passaram desde o ultimo flush; cada flush entrega
+    todas as linhas agregadas ao `writer` em uma unica chamada.
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[List[Dict[str, Any]]], None],
+        max_keys: int = 1000,
+        flush_interval: float = 10.0
+    ) -> None:
+        self._writer = writer
+        self._max_keys = max(1, max_keys)
+        self._flush_interval = max(0.0, flush_interval)
+        self._totals: Dict[UsageKey, int] = {}
+        self._lock = threading.Lock()
+        self._last_flush_at = time.monotonic()
+
+    def add(self, metrics: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for metric in metrics:
+                key = (
+                    str(metric["tenant_id"]),
+                    metric["metric_key"],
+                    metric["period"],
+                    metric.get("source") or "worker"
+                )
+                self._totals[key] = self._totals.get(key, 0) + int(metric["metric_value"])
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._totals)
+
+    def should_flush(self) -> bool:
+        with self._lock:
+            if not self._totals:
+                return False
+            if len(self._totals) >= self._max_keys:
+                return True
+            return time.monotonic() - self._last_flush_at >= self._flush_interval
+
+    def maybe_flush(self) -> int:
+        if not self.should_flush():
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """Grava o buffer; em caso de falha as contagens voltam ao buffer e o erro propaga."""
+        with self._lock:
+            totals = self._totals
+            self._totals = {}
+            self._last_flush_at = time.monotonic()
+        if not totals:
+            return 0
+
+        rows = [
+            {
+                "tenant_id": tenant_id,
+                "metric_key": metric_key,
+                "metric_value": value,
+                "period": period,
+                "source": source
+            }
+            for (tenant_id, metric_key, period, source), value in totals.items()
+        ]
+        try:
+            self._writer(rows)
+        except Exception:
+            with self._lock:
+                for key, value in totals.items():
+                    self._totals[key] = self._totals.get(key, 0) + value
+            raise
+        return len(rows)
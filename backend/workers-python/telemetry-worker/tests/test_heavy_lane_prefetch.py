@@ -0,0 +1,103 @@
+import json
+import logging
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("kafka")
+pytest.importorskip("minio")
+pytest.importorskip("ijson")
+
+from app import consumer
+from app.messages import EVENT_TYPE_HEADER, LazyMessage
+from app.retry import RetryEntry
+
+
+class _RecordingLane:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, item):
+        self.submitted.append(item)
+
+
+class _RecordingPrefetcher:
+    def __init__(self):
+        self.requested = []
+
+    def prefetch(self, key, size):
+        self.requested.append((key, size))
+        return True
+
+
+class _DueRetries:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def pop_due(self):
+        entries, self.entries = self.entries, []
+        return entries
+
+
+def _message(value, offset, event_type=None):
+    headers = {EVENT_TYPE_HEADER: event_type} if event_type else {}
+    return LazyMessage(json.dumps(value).encode("utf-8"), headers, topic="telemetry.raw", partition=0, offset=offset)
+
+
+def _claim_message(offset=10):
+    return _message(
+        {"event_id": "evt-claim", "payload": {"claim_check": "tenant/evt-claim.json.gz", "file_size": 2048}},
+        offset,
+        consumer.CLAIM_CHECK_EVENT_TYPE
+    )
+
+
+@pytest.fixture
+def lane(monkeypatch):
+    lane = _RecordingLane()
+    monkeypatch.setenv("STORAGE_TYPE", "minio")
+    monkeypatch.setenv("MINIO_BUCKET", "telemetry-raw")
+    monkeypatch.delenv("KAFKA_EVENT_TYPES", raising=False)
+    monkeypatch.setattr(consumer, "_get_heavy_lane", lambda: lane)
+    return lane
+
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    prefetcher = _RecordingPrefetcher()
+    monkeypatch.setattr(consumer, "_get_prefetcher", lambda: prefetcher)
+    return prefetcher
+
+
+def test_claim_check_batch_is_prefetched_before_heavy_lane(lane, prefetcher):
+    claim = _claim_message()
+    inline = _message({"event_id": "evt-inline", "items": []}, 11, "telemetry.ingest")
+
+    fast = consumer._dispatch_heavy([claim, inline], logging.getLogger("test"))
+
+    assert fast == [inline]
+    assert lane.submitted == [(claim, 0)]
+    assert prefetcher.requested == [(("telemetry-raw", "tenant/evt-claim.json.gz"), 2048)]
+    assert not inline.decoded
+
+
+def test_filtered_events_are_not_decoded(lane, prefetcher, monkeypatch):
+    monkeypatch.setenv("KAFKA_EVENT_TYPES", "telemetry.ingest")
+    filtered = _claim_message()
+
+    fast = consumer._dispatch_heavy([filtered], logging.getLogger("test"))
+
+    assert fast == [filtered]
+    assert lane.submitted == []
+    assert not filtered.decoded
+
+
+def test_due_claim_check_retry_goes_back_to_heavy_lane(lane, prefetcher, monkeypatch):
+    claim = _claim_message()
+    monkeypatch.setattr(consumer, "_get_retry_scheduler", lambda: _DueRetries([RetryEntry(claim, 2, "timeout", 0.0)]))
+    monkeypatch.setattr(consumer, "_process_records", lambda records: pytest.fail("claim-check reprocessado inline"))
+
+    consumer._run_due_retries(logging.getLogger("test"))
+
+    assert lane.submitted == [(claim, 2)]
+    assert prefetcher.requested == [(("telemetry-raw", "tenant/evt-claim.json.gz"), 2048)]
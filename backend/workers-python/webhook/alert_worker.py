@@ -1,11 +1,13 @@
-import json
 import logging
+import math
 import os
 from typing import Any, Dict, Optional
 
-import requests
+import psycopg2
 
+import outbox
 from config import webhooks_enabled
+from dispatcher import get_dispatcher
 
 
 def _setup_logger() -> logging.Logger:
@@ -17,28 +19,61 @@ def _setup_logger() -> logging.Logger:
     return logger
 
 
-def send_webhook(url: str, payload: Dict[str, Any], timeout_seconds: int = 5) -> None:
-    logger = _setup_logger()
+def process_alerts(alerts: Optional[list[Dict[str, Any]]] = None) -> None:
+    """Enfileira alertas na fila duravel; o envio acontece em `deliver_pending`."""
+    if not alerts:
+        return
+    deliveries = [
+        {
+            "tenant_id": alert.get("tenant_id"),
+            "event_type": alert.get("event_type") or "alert",
+            "target_url": alert["webhook_url"],
+            "idempotency_key": alert.get("alert_id") or alert.get("id"),
+            "payload": alert
+        }
+        for alert in alerts
+        if alert.get("webhook_url")
+    ]
+    outbox.enqueue(deliveries)
+
 
+def deliver_pending() -> int:
+    """Drena a fila de saida em lotes ate nao haver entregas vencidas."""
+    logger = _setup_logger()
     if not webhooks_enabled():
         logger.info("WEBHOOKS_ENABLED=false; envio ignorado.")
-        return
+        return 0
 
+    batch_size = int(os.getenv("WEBHOOK_CLAIM_BATCH_SIZE") or 100)
+    dispatcher = get_dispatcher()
+    # O lease nunca fica abaixo do pior caso do lote: expirado durante o envio, outra
+    # replica reenviaria as mesmas entregas.
+    lease_seconds = max(
+        int(os.getenv("WEBHOOK_LEASE_SECONDS") or 60),
+        math.ceil(dispatcher.max_dispatch_seconds(batch_size)) + 30
+    )
+    total = 0
     try:
-        response = requests.post(url, json=payload, timeout=timeout_seconds)
-        logger.info(
-            "Webhook enviado.",
-            extra={"status_code": response.status_code, "url": url}
-        )
-    except Exception as exc:
-        logger.warning("Falha ao enviar webhook.", extra={"error": str(exc), "url": url})
-
-
-def process_alerts(alerts: Optional[list[Dict[str, Any]]] = None) -> None:
-    if not alerts:
-        return
-    for alert in alerts:
-        url = alert.get("webhook_url")
-        if not url:
-            continue
-        send_webhook(url, alert)
+        while True:
+            batch = outbox.claim_batch(batch_size, lease_seconds)
+            if not batch:
+                return total
+            results = dispatcher.dispatch_all(
+                [(delivery.target_url, delivery.payload, delivery.request_headers()) for delivery in batch]
+            )
+            outbox.record_results(list(zip(batch, results)))
+            failed = [result for result in results if not result.delivered]
+            if failed:
+                logger.warning(
+                    "Webhooks nao entregues; reagendados.",
+                    extra={
+                        "failed": len(failed),
+                        "circuit_open": sum(1 for result in failed if result.circuit_open),
+                        "total": len(results)
+                    }
+                )
+            total += len(batch)
+    except psycopg2.Error as exc:
+        logger.warning("Falha ao acessar fila de webhooks.", extra={"error": str(exc)})
+        outbox.reset_connection()
+        return total
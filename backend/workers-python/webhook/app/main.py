@@ -2,7 +2,7 @@ import os
 import time
 
 from config import webhooks_enabled
-from alert_worker import process_alerts
+from alert_worker import deliver_pending
 
 
 def _get_env(name: str, default: str) -> str:
@@ -20,8 +20,8 @@ def main() -> None:
 
     while True:
         if webhooks_enabled():
-            # Placeholder: nenhum datasource de alertas ainda.
-            process_alerts([])
+            # Fonte de entregas: tabela webhook_outgoing_deliveries (alimentada por process_alerts/API).
+            deliver_pending()
         time.sleep(poll_seconds)
 
 
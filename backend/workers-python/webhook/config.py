@@ -9,3 +9,14 @@ def _get_env(name: str, default: str | None = None) -> str | None:
 def webhooks_enabled() -> bool:
     return (_get_env("WEBHOOKS_ENABLED", "false") or "false").lower() == "true"
 
+
+def database_url() -> str:
+    url = _get_env("DATABASE_URL")
+    if url:
+        return url
+    host = _get_env("POSTGRES_HOST", "localhost")
+    port = _get_env("POSTGRES_PORT", "5432")
+    user = _get_env("POSTGRES_USER", "postgres")
+    password = _get_env("POSTGRES_PASSWORD", "")
+    db = _get_env("POSTGRES_DB", "control_plane")
+    return f"postgresql://{user}:{password}@{host}:{port}/{db}"
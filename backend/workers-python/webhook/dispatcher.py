@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import http_client
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+# (url, payload, headers)
+Delivery = Tuple[str, Dict[str, Any], Optional[Dict[str, str]]]
+
+
+@dataclass
+class DeliveryResult:
+    url: str
+    delivered: bool
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    circuit_open: bool = False
+
+
+class TokenBucket:
+    """Limite de taxa por endpoint: `rate` envios/s com rajada de ate `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Abre apos `failure_threshold` falhas seguidas; libera uma tentativa apos `reset_seconds`."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_in_flight = False
+
+    def is_open(self) -> bool:
+        """Circuito aberto e ainda sem direito a tentativa de teste (nao altera o estado)."""
+        if self.opened_at is None:
+            return False
+        return self.half_open_in_flight or time.monotonic() - self.opened_at < self.reset_seconds
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.half_open_in_flight or time.monotonic() - self.opened_at < self.reset_seconds:
+            return False
+        self.half_open_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.half_open_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class WebhookDispatcher:
+    """Envia webhooks em paralelo com limite global, taxa por URL e circuit breaker por endpoint.
+
+    Buckets e breakers sobrevivem entre ciclos de polling; cada `dispatch` roda em seu
+    proprio event loop e usa o pool HTTP compartilhado via threads.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 50,
+        rate_per_second: float = 5.0,
+        burst: float = 10.0,
+        failure_threshold: int = 5,
+        reset_seconds: float = 60.0,
+        timeout_seconds: float = 5.0
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.timeout_seconds = timeout_seconds
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="webhook")
+        self._logger = logging.getLogger("webhook-worker")
+
+    def max_dispatch_seconds(self, deliveries: int) -> float:
+        """Limite superior de `dispatch` para um lote, com todas as entregas na mesma URL.
+
+        Soma a espera do rate limit as rodadas limitadas pela concorrencia (global e por
+        host), cada uma com ate dois timeouts (conexao e leitura). Sem retries HTTP sob o
+        breaker, nenhuma entrega passa disso.
+        """
+        if deliveries <= 0:
+            return 0.0
+        rate_wait = max(0.0, deliveries - self.burst) / max(self.rate_per_second, 0.001)
+        rounds = math.ceil(deliveries / min(self.max_concurrency, http_client.host_concurrency()))
+        return rate_wait + rounds * 2 * self.timeout_seconds
+
+    def dispatch_all(self, deliveries: List[Delivery]) -> List[DeliveryResult]:
+        if not deliveries:
+            return []
+        return asyncio.run(self.dispatch(deliveries))
+
+    async def dispatch(self, deliveries: List[Delivery]) -> List[DeliveryResult]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return list(
+            await asyncio.gather(
+                *(self._deliver(url, payload, headers, semaphore) for url, payload, headers in deliveries)
+            )
+        )
+
+    async def _deliver(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        headers: Optional[Dict[str, str]],
+        semaphore: asyncio.Semaphore
+    ) -> DeliveryResult:
+        breaker = self._breakers.setdefault(url, CircuitBreaker(self.failure_threshold, self.reset_seconds))
+        if breaker.is_open():
+            return DeliveryResult(url=url, delivered=False, error="circuit open", circuit_open=True)
+
+        bucket = self._buckets.setdefault(url, TokenBucket(self.rate_per_second, self.burst))
+        await bucket.acquire()
+        async with semaphore:
+            # O breaker pode ter aberto enquanto a entrega esperava o token ou a vaga.
+            if not breaker.allow():
+                return DeliveryResult(url=url, delivered=False, error="circuit open", circuit_open=True)
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(
+                    self._executor,
+                    lambda: http_client.post(
+                        url, retry=False, json=payload, headers=headers or None, timeout=self.timeout_seconds
+                    )
+                )
+            except Exception as exc:
+                breaker.record_failure()
+                self._logger.warning("Falha ao enviar webhook.", extra={"error": str(exc), "url": url})
+                return DeliveryResult(url=url, delivered=False, error=str(exc))
+
+        if response.status_code == 429 or response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        delivered = 200 <= response.status_code < 300
+        self._logger.info("Webhook enviado.", extra={"status_code": response.status_code, "url": url})
+        return DeliveryResult(
+            url=url,
+            delivered=delivered,
+            status_code=response.status_code,
+            error=None if delivered else f"HTTP {response.status_code}"
+        )
+
+
+_dispatcher: Optional[WebhookDispatcher] = None
+
+
+def get_dispatcher() -> WebhookDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = WebhookDispatcher(
+            max_concurrency=int(_get_env("WEBHOOK_MAX_CONCURRENCY", "50") or 50),
+            rate_per_second=float(_get_env("WEBHOOK_RATE_PER_SECOND", "5") or 5),
+            burst=float(_get_env("WEBHOOK_RATE_BURST", "10") or 10),
+            failure_threshold=int(_get_env("WEBHOOK_BREAKER_FAILURES", "5") or 5),
+            reset_seconds=float(_get_env("WEBHOOK_BREAKER_RESET_SECONDS", "60") or 60),
+            timeout_seconds=float(_get_env("WEBHOOK_TIMEOUT_SECONDS", "5") or 5)
+        )
+    return _dispatcher
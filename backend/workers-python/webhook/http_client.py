@@ -0,0 +1,105 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_sessions: Dict[bool, requests.Session] = {}
+_session_lock = threading.Lock()
+_host_limits: Dict[str, threading.BoundedSemaphore] = {}
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+class _SafeRetry(Retry):
+    """Retry que so reenvia metodos nao idempotentes em 429 e limita a espera do Retry-After.
+
+    Um 502/503/504 pode chegar depois que o servidor ja processou um POST (relatorio de
+    uso, webhook); reenviar duplicaria o efeito. Um 429 garante que nada foi processado.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() not in Retry.DEFAULT_ALLOWED_METHODS and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response: Any) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, float(_get_env("HTTP_RETRY_AFTER_MAX_SECONDS", "30") or 30))
+
+
+def get_session(retry: bool = True) -> requests.Session:
+    """Sessao compartilhada: pool de conexoes keep-alive por host e retries com backoff.
+
+    `retry=False` devolve uma sessao sem retries, para chamadas protegidas por circuit
+    breaker: cada falha chega ao breaker na hora, sem o atraso dos reenvios.
+    """
+    session = _sessions.get(retry)
+    if session is not None:
+        return session
+    with _session_lock:
+        session = _sessions.get(retry)
+        if session is None:
+            session = _sessions[retry] = _build_session(retry)
+    return session
+
+
+def _build_session(retry_enabled: bool = True) -> requests.Session:
+    retries = int(_get_env("HTTP_MAX_RETRIES", "3") or 3) if retry_enabled else 0
+    # Sem retry de leitura e, para POST, so em 429: um POST que chegou ao servidor nao
+    # deve ser reenviado as cegas.
+    retry = _SafeRetry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=None,
+        backoff_factor=float(_get_env("HTTP_RETRY_BACKOFF", "0.5") or 0.5),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=int(_get_env("HTTP_POOL_CONNECTIONS", "10") or 10),
+        pool_maxsize=int(_get_env("HTTP_POOL_MAXSIZE", "20") or 20),
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _host_limit(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc
+    limit = _host_limits.get(host)
+    if limit is not None:
+        return limit
+    with _session_lock:
+        limit = _host_limits.get(host)
+        if limit is None:
+            limit = threading.BoundedSemaphore(host_concurrency())
+            _host_limits[host] = limit
+    return limit
+
+
+def host_concurrency() -> int:
+    return max(1, int(_get_env("HTTP_MAX_CONCURRENCY_PER_HOST", "10") or 10))
+
+
+def request(method: str, url: str, retry: bool = True, **kwargs: Any) -> requests.Response:
+    kwargs.setdefault("timeout", float(_get_env("HTTP_TIMEOUT_SECONDS", "5") or 5))
+    with _host_limit(url):
+        return get_session(retry).request(method, url, **kwargs)
+
+
+def post(url: str, retry: bool = True, **kwargs: Any) -> requests.Response:
+    return request("POST", url, retry=retry, **kwargs)
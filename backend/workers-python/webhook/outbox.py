@@ -0,0 +1,185 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from config import database_url
+from dispatcher import DeliveryResult
+
+_conn: Optional[Any] = None
+
+
+def _get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, default)
+    return value if value is not None and value != "" else default
+
+
+@dataclass
+class OutgoingDelivery:
+    id: int
+    target_url: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    idempotency_key: Optional[str] = None
+
+    def request_headers(self) -> Dict[str, str]:
+        """Headers do envio; `Idempotency-Key` permite ao receptor descartar reenvios."""
+        if not self.idempotency_key or "Idempotency-Key" in self.headers:
+            return self.headers
+        return {**self.headers, "Idempotency-Key": self.idempotency_key}
+
+
+def get_connection() -> Any:
+    global _conn
+    if _conn is None or _conn.closed:
+        _conn = psycopg2.connect(database_url())
+    return _conn
+
+
+def reset_connection() -> None:
+    global _conn
+    if _conn is not None and not _conn.closed:
+        _conn.close()
+    _conn = None
+
+
+def enqueue(deliveries: List[Dict[str, Any]]) -> int:
+    """Insere entregas pendentes; entregas com (target_url, idempotency_key) repetidos sao ignoradas."""
+    if not deliveries:
+        return 0
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO webhook_outgoing_deliveries
+                (tenant_id, event_type, target_url, idempotency_key, headers_json, payload_json, max_attempts)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                """,
+                [
+                    (
+                        str(delivery["tenant_id"]) if delivery.get("tenant_id") is not None else None,
+                        delivery.get("event_type"),
+                        delivery["target_url"],
+                        delivery.get("idempotency_key"),
+                        Json(delivery.get("headers") or {}),
+                        Json(delivery["payload"]),
+                        int(delivery.get("max_attempts") or _get_env("WEBHOOK_MAX_ATTEMPTS", "10") or 10)
+                    )
+                    for delivery in deliveries
+                ],
+                template="((SELECT id FROM tenants WHERE uuid::text = %s), %s, %s, %s, %s, %s, %s)"
+            )
+            inserted = cursor.rowcount
+        conn.commit()
+        return inserted
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def claim_batch(limit: int, lease_seconds: int) -> List[OutgoingDelivery]:
+    """Reserva ate `limit` entregas vencidas; o lease e registrado em next_attempt_at.
+
+    SKIP LOCKED permite varias replicas drenando a fila em paralelo. Se a replica cair
+    durante o envio, a entrega volta a ficar elegivel quando o lease expira; o lease
+    precisa cobrir o pior caso de `dispatch` do lote, senao outra replica reenvia.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH claimed AS (
+                  SELECT id
+                  FROM webhook_outgoing_deliveries
+                  WHERE status = 'pending' AND next_attempt_at <= now()
+                  ORDER BY next_attempt_at
+                  LIMIT %s
+                  FOR UPDATE SKIP LOCKED
+                )
+                UPDATE webhook_outgoing_deliveries d
+                SET attempts = d.attempts + 1,
+                    next_attempt_at = now() + make_interval(secs => %s),
+                    updated_at = now()
+                FROM claimed
+                WHERE d.id = claimed.id
+                RETURNING d.id, d.target_url, d.payload_json, d.headers_json, d.attempts, d.max_attempts, d.idempotency_key
+                """,
+                (limit, lease_seconds)
+            )
+            rows = cursor.fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [
+        OutgoingDelivery(
+            id=row[0],
+            target_url=row[1],
+            payload=row[2],
+            headers=row[3] or {},
+            attempts=row[4],
+            max_attempts=row[5],
+            idempotency_key=row[6]
+        )
+        for row in rows
+    ]
+
+
+def record_results(results: List[Tuple[OutgoingDelivery, DeliveryResult]]) -> None:
+    """Grava o resultado do lote em um unico UPDATE, agendando retries com backoff exponencial."""
+    if not results:
+        return
+    base_delay = float(_get_env("WEBHOOK_RETRY_BASE_SECONDS", "30") or 30)
+    max_delay = float(_get_env("WEBHOOK_RETRY_MAX_SECONDS", "3600") or 3600)
+
+    rows = []
+    for delivery, result in results:
+        attempts_delta = 0
+        delay = 0.0
+        if result.delivered:
+            status = "delivered"
+        elif result.circuit_open:
+            # Endpoint com circuito aberto: nao conta como tentativa.
+            status = "pending"
+            attempts_delta = -1
+            delay = base_delay
+        elif delivery.attempts >= delivery.max_attempts:
+            status = "failed"
+        else:
+            status = "pending"
+            delay = min(max_delay, base_delay * (2 ** (delivery.attempts - 1)))
+        rows.append((delivery.id, status, delay, result.status_code, result.error, attempts_delta))
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                UPDATE webhook_outgoing_deliveries d
+                SET status = v.status,
+                    attempts = d.attempts + v.attempts_delta,
+                    next_attempt_at = now() + make_interval(secs => v.delay),
+                    last_status_code = v.status_code,
+                    last_error = v.error,
+                    delivered_at = CASE WHEN v.status = 'delivered' THEN now() ELSE d.delivered_at END,
+                    updated_at = now()
+                FROM (VALUES %s) AS v (id, status, delay, status_code, error, attempts_delta)
+                WHERE d.id = v.id
+                """,
+                rows,
+                template="(%s::int, %s, %s::float8, %s::int, %s, %s::int)",
+                page_size=len(rows)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise